@@ -2,7 +2,11 @@ import streamlit as st
 import requests
 import pandas as pd
 import uuid
-from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import partial
+from task_client import get_json
 # from streamlit_calendar import calendar
 # import matplotlib.pyplot as plt
 
@@ -12,6 +16,11 @@ REMINDER_SERVICE_URL = "http://reminder_service:5002"
 TASK_FILTER_URL = "http://task_filter:5003"
 PRODUCTIVITY_ANALYSIS_URL = "http://productivity_analysis:5004"
 
+# Seconds each request may take before its part of the page is given up on
+REQUEST_TIMEOUT = 5
+# Requests that don't depend on each other go out together
+fetch_pool = ThreadPoolExecutor(max_workers=8)
+
 # Initialize session state for undo and redo stacks
 if "undo_stack" not in st.session_state:
     st.session_state["undo_stack"] = []
@@ -30,6 +39,113 @@ if "undo_message" not in st.session_state:
 if "redo_message" not in st.session_state:
     st.session_state["redo_message"] = ""
 
+def get_task_stats_json(path, params=None):
+    """GET a task_stats endpoint, revalidating the last response with its
+    ETag so unchanged data isn't downloaded again. Returns None on errors."""
+    try:
+        return get_json(path, params=params, base_url=TASK_STATS_URL, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        return None
+
+# Data layer: the pages read one snapshot per rerun instead of calling the
+# services themselves. A snapshot holds the service responses the page
+# needs, each cached per task_stats version (and day, since reminders and
+# the productivity windows are relative to today), so reruns that changed
+# nothing (switching pages, ticking a checkbox) only ask task_stats for its
+# version. The services still do the filtering and the analysis; the
+# dashboard only downloads their results. When parts do have to be
+# fetched, they are fetched concurrently, and a part that fails or times
+# out is None while the sections using the other parts still render.
+
+# Snapshot part -> (service URL, path, query parameters)
+SNAPSHOT_SOURCES = {
+    "pending_tasks": (TASK_STATS_URL, "/query_tasks", {"completed": "false", "fields": "id,title"}),
+    "stats": (TASK_STATS_URL, "/stats", {}),
+    "summary": (TASK_STATS_URL, "/task_summary", {}),
+    "completion_times": (TASK_STATS_URL, "/completion_times", {}),
+    "productivity": (PRODUCTIVITY_ANALYSIS_URL, "/productivity", {}),
+    "reminders": (REMINDER_SERVICE_URL, "/reminders", {}),
+}
+
+def fetch_concurrently(calls):
+    """Run {name: function} in the fetch pool. Returns {name: result}, with
+    None for the calls that raised requests.RequestException."""
+    futures = {name: fetch_pool.submit(call) for name, call in calls.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except requests.RequestException:
+            results[name] = None
+    return results
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_resource(base_url, path, params, version, day):
+    """A service response computed from the tasks, at the given task_stats
+    version and day. Raises requests.RequestException on errors, which
+    aren't cached."""
+    return get_json(path, params=params, base_url=base_url, timeout=REQUEST_TIMEOUT)
+
+def get_snapshot(parts):
+    """This rerun's snapshot, {part: data or None}, with the given parts.
+    The task_stats version is looked up once per rerun; parts not fetched
+    yet this rerun are fetched concurrently. Parts are missing if task_stats
+    can't be reached."""
+    snapshot = st.session_state.get("snapshot")
+    if snapshot is None:
+        version = get_task_stats_json("/version")
+        snapshot = {"version": f"{version['instance']}-{version['version']}" if version is not None else None}
+        st.session_state["snapshot"] = snapshot
+    missing = [part for part in parts if part not in snapshot]
+    if missing and snapshot["version"] is not None:
+        day = date.today().isoformat()
+        snapshot.update(fetch_concurrently({
+            part: partial(load_resource, *SNAPSHOT_SOURCES[part], snapshot["version"], day) for part in missing
+        }))
+    return snapshot
+
+def get_snapshot_part(part):
+    """A part of this rerun's snapshot, or None if it couldn't be fetched"""
+    return get_snapshot((part,)).get(part)
+
+def get_filtered_tasks(params):
+    """/filter_tasks result for the given filters at this rerun's version,
+    or None if it couldn't be fetched"""
+    version = get_snapshot(()).get("version")
+    if version is None:
+        return None
+    try:
+        return load_resource(TASK_FILTER_URL, "/filter_tasks", params, version, date.today().isoformat())
+    except requests.RequestException:
+        return None
+
+def invalidate_snapshot():
+    """Called after a change to the tasks, so the pages drawn after it in
+    the same rerun see it too. The change gives task_stats a new version,
+    so the responses cached for the old one are simply not read again."""
+    st.session_state["snapshot"] = None
+
+def fetch_page_data(page):
+    """Fetch stage at the start of a rerun: the snapshot parts the page
+    reads and, if it needs it, the saved filter preference, which comes
+    from another service and is fetched at the same time"""
+    preference = fetch_pool.submit(load_saved_preference) if page.preference else None
+    if page.parts:
+        get_snapshot(page.parts)
+    if preference is not None:
+        try:
+            st.session_state["saved_preference"] = preference.result()
+        except requests.RequestException:
+            st.session_state["saved_preference"] = None
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_saved_preference():
+    """The most recently saved filter preference, or None"""
+    response = requests.get(f"{TASK_FILTER_URL}/get_saved_preferences", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    saved = response.json().get("saved_preferences")
+    return saved[0] if saved else None
+
 def reset_form():
     st.session_state['add_task_title_form'] = ''
     st.session_state['add_task_description_form'] = ''
@@ -131,6 +247,7 @@ def handle_add_task(title, description, due_date, priority, message_type):
 
     response = requests.post(f"{TASK_STATS_URL}/add_task", json=task_data)
     if response.ok:
+        invalidate_snapshot()
         success_message = f"Task '{title}' added successfully!"
         if message_type == "form":
             st.session_state["add_task_form_message"] = success_message
@@ -141,7 +258,7 @@ def handle_add_task(title, description, due_date, priority, message_type):
             st.success(st.session_state["add_task_quick_message"])
             st.session_state["add_task_quick_message"] = ""
         # Log the action for undo functionality
-        action = {"action": "add_task", "task": task_data}
+        action = {"action": "add_task", "tasks": [task_data]}
         st.session_state["undo_stack"].append(action)
         # Clear the redo stack
         st.session_state["redo_stack"].clear()
@@ -233,10 +350,9 @@ def mark_task_complete_checkbox():
         # Remove the confirmation flag
         del st.session_state[f"confirm_mark_complete_{task_id}"]
 
-    response = requests.get(f"{TASK_STATS_URL}/view_tasks")
-    if response.ok:
-        tasks = response.json()["tasks"]
-        for task in tasks:
+    data = get_snapshot_part("pending_tasks")
+    if data is not None:
+        for task in data["tasks"]:
             if not task.get("completed", False):
                 checkbox_key = f"complete_{task['id']}"
                 if st.checkbox(f"{task['title']} (ID: {task['id']})", key=checkbox_key):
@@ -261,13 +377,17 @@ def handle_mark_task_complete(task_id):
     response = requests.post(f"{REMINDER_SERVICE_URL}/mark_complete", json={"id": task_id})
 
     if response.ok:
+        invalidate_snapshot()
         # Set success message in session state
         st.session_state["mark_complete_message"] = response.json().get("message", "Task marked as complete!")
         # Log the action for undo functionality
-        action = {"action": "mark_complete", "task_id": task_id}
+        action = {"action": "mark_complete", "task_ids": [task_id]}
         st.session_state["undo_stack"].append(action)
         # Clear the redo stack
         st.session_state["redo_stack"].clear()
+    elif response.status_code in (404, 409):
+        # Unknown or already completed task, nothing to undo
+        st.session_state["mark_complete_message"] = response.json().get("message")
     else:
         # Set error message in session state
         st.session_state["mark_complete_message"] = "Error marking task as complete."
@@ -284,12 +404,8 @@ def view_tasks():
         st.session_state.clear_filters = False
 
     # Load saved preferences
-    saved_prefs_response = requests.get(f"{TASK_FILTER_URL}/get_saved_preferences")
-    saved_preference = None
-    if saved_prefs_response.ok:
-        preferences_data = saved_prefs_response.json()
-        if preferences_data.get("saved_preferences"):
-            saved_preference = preferences_data["saved_preferences"][0]  # Get the single saved preference
+    # Fetched by fetch_page_data
+    saved_preference = st.session_state.get("saved_preference")
 
     # Initialize filter values from saved preference or defaults
     default_priority = saved_preference.get("priority", "all") if saved_preference else "all"
@@ -368,12 +484,14 @@ def view_tasks():
                     }
                     response = requests.post(f"{TASK_FILTER_URL}/save_filter_preferences", json=preferences)
                     if response.ok:
+                        load_saved_preference.clear()
                         st.success("Filter preferences saved!")
                         st.rerun()
 
                 if st.button("🗑️ Clear Saved", key="clear_pref"):
                     response = requests.post(f"{TASK_FILTER_URL}/clear_preferences")
                     if response.ok:
+                        load_saved_preference.clear()
                         st.success("Saved preferences cleared!")
                         st.rerun()
                 
@@ -389,9 +507,9 @@ def view_tasks():
     if completed != "all":
         params["completed"] = "true" if completed == "completed" else "false"
 
-    response = requests.get(f"{TASK_FILTER_URL}/filter_tasks", params=params)
-    if response.ok:
-        tasks = response.json()["filtered_tasks"]
+    data = get_filtered_tasks(params)
+    if data is not None:
+        tasks = data["filtered_tasks"]
         if tasks:
             df = pd.DataFrame(tasks)
             
@@ -514,9 +632,8 @@ def get_task_stats():
     # Top containers for key stats
     col1, col2, col3 = st.columns(3)
     with col1:
-        response = requests.get(f"{TASK_STATS_URL}/stats")
-        if response.ok:
-            stats = response.json()
+        stats = get_snapshot_part("stats")
+        if stats is not None:
             st.metric(label="Total Tasks", value=stats["total_tasks"])
             st.metric(label="Completed Tasks", value=stats["completed_tasks"])
             st.metric(label="Pending Tasks", value=stats["pending_tasks"])
@@ -526,9 +643,8 @@ def get_task_stats():
 
     # Stacked bar chart for task completion by priority
     st.markdown("### Task Completion by Priority")
-    response = requests.get(f"{TASK_STATS_URL}/task_summary")
-    if response.ok and response.json():  # Check if data exists
-        summary = response.json()
+    summary = get_snapshot_part("summary")
+    if summary:  # Check if data exists
         df = pd.DataFrame.from_dict(summary, orient="index")
         df.columns = ["Completed", "Not Completed"]
         
@@ -540,9 +656,8 @@ def get_task_stats():
 
     # Scatter plot for task completion times
     st.markdown("### Task Completion Times")
-    response = requests.get(f"{TASK_STATS_URL}/completion_times")
-    if response.ok and response.json():  # Check if data exists
-        completion_times = response.json()
+    completion_times = get_snapshot_part("completion_times")
+    if completion_times:  # Check if data exists
         completion_df = pd.DataFrame(completion_times)
 
         # Ensure that we have 'completion_time' column for scatter plot
@@ -571,9 +686,8 @@ def productivity_analysis():
         st.session_state["redo_message"] = ""
 
     if st.button("Get Productivity"):
-        response = requests.get(f"{PRODUCTIVITY_ANALYSIS_URL}/productivity")
-        if response.ok:
-            data = response.json()
+        data = get_snapshot_part("productivity")
+        if data is not None:
             # Display the productivity data not as st.write
             st.info(f"Productivity Percentage: {data['productivity_percentage']:.2f}%",icon="🚀")
             #st.write(f"Productivity Percentage: {data['productivity_percentage']:.2f}%")
@@ -589,9 +703,9 @@ def filter_tasks():
 
     priority = st.selectbox("Select priority to filter tasks:", ["low", "medium", "high"])
     if st.button("Filter Tasks"):
-        response = requests.get(f"{TASK_FILTER_URL}/filter_tasks", params={"priority": priority})
-        if response.ok:
-            tasks = response.json()["filtered_tasks"]
+        data = get_filtered_tasks({"priority": priority})
+        if data is not None:
+            tasks = data["filtered_tasks"]
             if tasks:
                 df = pd.DataFrame(tasks)
                 st.dataframe(df)
@@ -607,9 +721,9 @@ def display_reminders():
     st.info("**Benefits:** Keeps you informed about upcoming deadlines, helping you stay on top of your tasks.")
     st.warning("**Costs:** Relies on accurate due dates; incorrect dates may lead to irrelevant reminders.")
 
-    response = requests.get(f"{REMINDER_SERVICE_URL}/reminders")
-    if response.ok:
-        reminders = response.json()["upcoming_tasks"]
+    data = get_snapshot_part("reminders")
+    if data is not None:
+        reminders = data["upcoming_tasks"]
         if reminders:
             # Only display title, priority, and due date if the task is not completed
             if "completed" in reminders[0]:
@@ -627,6 +741,27 @@ def display_reminders():
     else:
         st.error("Error fetching reminders.")
 
+def set_tasks_completed(task_ids, completed):
+    """Complete or reopen tasks with one /complete_tasks request, each only
+    if nobody changed it since. Returns the ids that changed and a
+    description of the ones that didn't, or (None, None) if the request
+    failed."""
+    items = [{"id": task_id, "completed": completed} for task_id in task_ids]
+    response = requests.post(f"{TASK_STATS_URL}/complete_tasks", json={"tasks": items})
+    if not response.ok:
+        return None, None
+    changed, skipped = [], []
+    for task_id, result in zip(task_ids, response.json()["results"]):
+        if result["status"] == "updated":
+            changed.append(task_id)
+        elif result["status"] == "conflict":
+            skipped.append(f"'{task_id}' is already {'complete' if completed else 'pending'}")
+        elif result["status"] == "not_found":
+            skipped.append(f"'{task_id}' no longer exists")
+        else:
+            skipped.append(f"'{task_id}' could not be changed")
+    return changed, ", ".join(skipped)
+
 def undo_action():
     if not st.session_state["undo_stack"]:
         st.session_state["undo_message"] = "No actions to undo."
@@ -635,27 +770,34 @@ def undo_action():
     last_action = st.session_state["undo_stack"].pop()
     action_type = last_action["action"]
 
+    # Actions can cover several tasks, each is reverted with one batch request
     if action_type == "add_task":
-        task_id = last_action["task"]["id"]
-        task_title = last_action["task"]["title"]
-        # Communicate with task_stats to delete the task
-        response = requests.post(f"{TASK_STATS_URL}/delete_task", json={"id": task_id})
+        task_ids = [task["id"] for task in last_action["tasks"]]
+        task_titles = ", ".join(f"'{task['title']}'" for task in last_action["tasks"])
+        # Communicate with task_stats to delete the tasks
+        response = requests.post(f"{TASK_STATS_URL}/delete_tasks", json={"ids": task_ids})
         if response.ok:
-            st.session_state["undo_message"] = f"Undo: Addition of task '{task_title}' has been reverted."
+            invalidate_snapshot()
+            st.session_state["undo_message"] = f"Undo: Addition of task {task_titles} has been reverted."
             # Add to redo stack
             st.session_state["redo_stack"].append(last_action)
         else:
             st.session_state["undo_message"] = "Error undoing add task action."
     elif action_type == "mark_complete":
-        task_id = last_action["task_id"]
-        # Revert task to incomplete in task_stats
-        response = requests.post(f"{TASK_STATS_URL}/update_task", json={"id": task_id, "completed": False})
-        if response.ok:
-            st.session_state["undo_message"] = f"Undo: Completion of task ID '{task_id}' has been reverted."
-            # Add to redo stack
-            st.session_state["redo_stack"].append(last_action)
-        else:
+        # Reopen the tasks in task_stats, unless someone reopened them since
+        changed, skipped = set_tasks_completed(last_action["task_ids"], False)
+        if changed is None:
             st.session_state["undo_message"] = "Error undoing mark complete action."
+            return
+        message = []
+        if changed:
+            invalidate_snapshot()
+            message.append(f"Undo: Completion of task ID '{', '.join(changed)}' has been reverted.")
+            # Add to redo stack, only the tasks that were reopened
+            st.session_state["redo_stack"].append({"action": "mark_complete", "task_ids": changed})
+        if skipped:
+            message.append(f"Not reverted: {skipped}.")
+        st.session_state["undo_message"] = " ".join(message)
 
 def redo_action():
     if not st.session_state["redo_stack"]:
@@ -666,60 +808,72 @@ def redo_action():
     action_type = last_action["action"]
 
     if action_type == "add_task":
-        task_data = last_action["task"]
-        task_title = task_data["title"]
-        # Re-add the task via task_stats
-        response = requests.post(f"{TASK_STATS_URL}/add_task", json=task_data)
+        task_titles = ", ".join(f"'{task['title']}'" for task in last_action["tasks"])
+        # Re-add the tasks via task_stats
+        response = requests.post(f"{TASK_STATS_URL}/add_tasks", json={"tasks": last_action["tasks"]})
         if response.ok:
-            st.session_state["redo_message"] = f"Redo: Addition of task '{task_title}' has been reapplied."
+            invalidate_snapshot()
+            st.session_state["redo_message"] = f"Redo: Addition of task {task_titles} has been reapplied."
             # Add back to undo stack
             st.session_state["undo_stack"].append(last_action)
         else:
             st.session_state["redo_message"] = "Error redoing add task action."
     elif action_type == "mark_complete":
-        task_id = last_action["task_id"]
-        # Mark the task as complete via reminder_service
-        response = requests.post(f"{REMINDER_SERVICE_URL}/mark_complete", json={"id": task_id})
-        if response.ok:
-            st.session_state["redo_message"] = f"Redo: Completion of task ID '{task_id}' has been reapplied."
-            # Add back to undo stack
-            st.session_state["undo_stack"].append(last_action)
-        else:
+        # Complete the tasks again in task_stats, unless someone completed
+        # them since
+        changed, skipped = set_tasks_completed(last_action["task_ids"], True)
+        if changed is None:
             st.session_state["redo_message"] = "Error redoing mark complete action."
+            return
+        message = []
+        if changed:
+            invalidate_snapshot()
+            message.append(f"Redo: Completion of task ID '{', '.join(changed)}' has been reapplied.")
+            # Add back to undo stack, only the tasks that were completed
+            st.session_state["undo_stack"].append({"action": "mark_complete", "task_ids": changed})
+        if skipped:
+            message.append(f"Not reapplied: {skipped}.")
+        st.session_state["redo_message"] = " ".join(message)
+
+def add_task_page():
+    add_task_form()
+    add_task_quick()
+
+def mark_complete_page():
+    mark_task_complete_list()
+    mark_task_complete_checkbox()
+
+# Dashboard pages: the function drawing each one, the snapshot parts it
+# reads and whether it needs the saved filter preference
+Page = namedtuple("Page", "render parts preference")
+PAGES = {
+    "📝 Add Task": Page(add_task_page, (), False),
+    "✅ Mark Complete": Page(mark_complete_page, ("pending_tasks",), False),
+    "📋 View Tasks": Page(view_tasks, (), True),
+    "📊 Stats": Page(get_task_stats, ("stats", "summary", "completion_times"), False),
+    "📈 Productivity": Page(productivity_analysis, ("productivity",), False),
+    "⏰ Reminders": Page(display_reminders, ("reminders",), False),
+}
 
 def main():
     st.sidebar.title("🔧 Task Management Controls")
     st.sidebar.markdown("Use the buttons below for quick actions.")
     st.title("🌌 Task Management Dashboard")
-    # page = st.sidebar.selectbox(
-    #     "Select Page",
-    #     ["📝 Add Task", "✅ Mark Complete", "📋 View Tasks", 
-    #      "📊 Stats", "📈 Productivity", "⏰ Reminders"]
-    # )
-    tabs=st.tabs(
-        ["📝 Add Task", "✅ Mark Complete", "📋 View Tasks",
-         "📊 Stats", "📈 Productivity", "⏰ Reminders"]
-    )
-    with tabs[0]:
-        add_task_form()
-        add_task_quick()
-    with tabs[1]:
-        mark_task_complete_list()
-        mark_task_complete_checkbox()
-    with tabs[2]:
-        view_tasks()
-    with tabs[3]:
-        get_task_stats()
-    with tabs[4]:
-        productivity_analysis()
-    with tabs[5]:
-        display_reminders()
+    # Each rerun starts with a fresh snapshot
+    st.session_state["snapshot"] = None
+
+    # Only the selected page is fetched and drawn on a rerun
+    page = PAGES[st.sidebar.selectbox("Select Page", list(PAGES), key="page")]
 
+    # Undo and redo before the page is drawn, so it shows the result
     st.sidebar.header("Actions")
     if st.sidebar.button("Undo Last Action"):
         undo_action()
     if st.sidebar.button("Redo Last Action"):
         redo_action()
 
+    fetch_page_data(page)
+    page.render()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import threading
+import time
+
+# User and preference names end up in file names, so keep them plain
+NAME_PATTERN = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}")
+DEFAULT_USER = "default"
+DEFAULT_NAME = "default"
+
+
+def check_name(value, kind):
+    """Return value if it is a valid user or preference name, otherwise
+    raise ValueError"""
+    if not isinstance(value, str) or not NAME_PATTERN.fullmatch(value):
+        raise ValueError(f"Invalid {kind} name")
+    return value
+
+
+class PreferenceStore:
+    """Named filter preferences per user, one JSON file per user.
+
+    Each user's preferences are cached in memory together with the mtime of
+    their file, so reads only stat the file and re-read it when something
+    else changed it. Saves update the cached copy and mark the user dirty;
+    a writer thread waits save_delay seconds so a burst of saves is written
+    once, then replaces the user's file atomically (temp file + rename), so
+    a crash leaves either the old or the new file, never half of one.
+    Callers block until their change is on disk, and get the OSError if
+    writing it failed. A file that can't be read or parsed also raises
+    OSError.
+    """
+
+    def __init__(self, directory, save_delay=0.05):
+        self.directory = directory
+        self.save_delay = save_delay
+        self.lock = threading.Lock()
+        self.written = threading.Condition(self.lock)
+        # user -> (mtime_ns, {name: preference}) as last read or written
+        self.cache = {}
+        # user -> generations of the changes not yet on disk
+        self.dirty = {}
+        # generation -> error from the failed write that was to store that
+        # change, raised to the saver that made it
+        self.errors = {}
+        self.generation = 0
+        self.written_generation = 0
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._write_loop, name="preference-writer", daemon=True).start()
+
+    def _path(self, user):
+        return os.path.join(self.directory, f"{user}.json")
+
+    def _load(self, user):
+        """The user's preferences, from the cache unless the file changed.
+        Called with the lock held."""
+        if user in self.dirty:
+            return self.cache[user][1]
+        path = self._path(user)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        cached = self.cache.get(user)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        preferences = {}
+        if mtime is not None:
+            with open(path, encoding="utf-8") as f:
+                try:
+                    preferences = json.load(f)["preferences"]
+                except (ValueError, KeyError, TypeError):
+                    preferences = None
+            # A file that isn't valid JSON or lacks the preferences object
+            # fails like one that can't be read
+            if not isinstance(preferences, dict):
+                raise OSError(f"Invalid preferences file for user {user}")
+        self.cache[user] = (mtime, preferences)
+        return preferences
+
+    def get(self, user, name=None):
+        """The user's preferences, most recently saved first, or only the
+        named one"""
+        with self.lock:
+            preferences = self._load(user)
+            if name is not None:
+                return [preferences[name]] if name in preferences else []
+            return list(reversed(preferences.values()))
+
+    def save(self, user, name, preference):
+        """Store a preference under name, replacing any with that name"""
+        def change(preferences):
+            # Re-insert so preferences stay in the order they were saved
+            preferences.pop(name, None)
+            preferences[name] = dict(preference, name=name)
+        self._change(user, change)
+
+    def clear(self, user, name=None):
+        """Remove the named preference, or all of the user's preferences"""
+        self._change(user, lambda preferences: preferences.pop(name, None) if name else preferences.clear())
+
+    def _change(self, user, change):
+        with self.lock:
+            # Copy on write, so a list returned by get isn't changed later
+            preferences = dict(self._load(user))
+            change(preferences)
+            self.cache[user] = (self.cache[user][0], preferences)
+            self.generation += 1
+            generation = self.generation
+            self.dirty.setdefault(user, []).append(generation)
+            self.written.notify_all()
+            while self.written_generation < generation:
+                self.written.wait()
+            error = self.errors.pop(generation, None)
+            if error is not None:
+                raise error
+
+    def _write_loop(self):
+        while True:
+            with self.lock:
+                while not self.dirty:
+                    self.written.wait()
+            # Let the rest of a burst of saves arrive before writing
+            time.sleep(self.save_delay)
+            with self.lock:
+                dirty, self.dirty = self.dirty, {}
+                generation = self.generation
+                pending = {user: self.cache[user][1] for user in dirty}
+            for user, preferences in pending.items():
+                try:
+                    mtime = self._write(user, preferences)
+                except OSError as e:
+                    with self.lock:
+                        # Every change in the failed write gets the error
+                        for change in dirty[user]:
+                            self.errors[change] = e
+                        # Forget the unsaved copy so the file is read again
+                        if user not in self.dirty:
+                            self.cache.pop(user, None)
+                    continue
+                with self.lock:
+                    if user not in self.dirty:
+                        self.cache[user] = (mtime, preferences)
+            with self.lock:
+                self.written_generation = generation
+                self.written.notify_all()
+
+    def _write(self, user, preferences):
+        path = self._path(user)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"preferences": preferences}, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o666)
+        os.replace(tmp_path, path)
+        return os.stat(path).st_mtime_ns
+
+    def import_file(self, path, user=DEFAULT_USER):
+        """Import the preferences of the old single filter_preferences.json
+        file for user, unless the user already has preferences"""
+        if not os.path.exists(path) or self.get(user):
+            return
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f).get("saved_preferences", [])
+        if saved:
+            self.save(user, DEFAULT_NAME, saved[0])
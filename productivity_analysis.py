@@ -1,19 +1,198 @@
 from flask import Flask, jsonify, request
+from datetime import date, timedelta
+import threading
 import requests
+from task_client import TaskReplica
+from task_store import task_owner
 
 app = Flask(__name__)
 
+# Rolling windows of the detailed view, in days
+WINDOWS = (7, 30, 90)
+# Default and largest number of days in the daily trend
+TREND_DAYS = 30
+MAX_TREND_DAYS = 365
+TASK_FIELDS = ["priority", "completed", "created_at", "stopped_at", "user_id"]
+
+
+def task_day(timestamp):
+    """YYYY-MM-DD day of a "YYYY-MM-DD HH:MM:SS" timestamp, or None"""
+    if isinstance(timestamp, str) and len(timestamp) == 19:
+        return timestamp[:10]
+    return None
+
+
+def rate(completed, total):
+    return float(completed) / total * 100 if total else 0
+
+
+class ProductivityCounters:
+    """Task counts kept current from task changes.
+
+    Holds total/completed counts overall and per priority, and per day
+    bucket the tasks created that day (and how many of them are completed)
+    and the tasks completed that day. update(old, new) has the TaskReplica
+    listener signature: it takes the old task's contribution out and adds
+    the new one, so each change costs O(1) and reads never touch the tasks.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.completed = 0
+        # priority -> [total, completed]
+        self.priorities = {}
+        # day -> [created that day, of those completed]
+        self.created_days = {}
+        # day -> completed that day
+        self.completed_days = {}
+        self.lock = threading.Lock()
+
+    def _bump(self, buckets, key, index, delta):
+        counts = buckets.setdefault(key, [0, 0])
+        counts[index] += delta
+        if not any(counts):
+            del buckets[key]
+
+    def _apply(self, task, sign):
+        completed = bool(task.get("completed"))
+        self.total += sign
+        self._bump(self.priorities, task.get("priority") or "low", 0, sign)
+        created = task_day(task.get("created_at"))
+        if created:
+            self._bump(self.created_days, created, 0, sign)
+        if completed:
+            self.completed += sign
+            self._bump(self.priorities, task.get("priority") or "low", 1, sign)
+            if created:
+                self._bump(self.created_days, created, 1, sign)
+            stopped = task_day(task.get("stopped_at"))
+            if stopped:
+                count = self.completed_days.get(stopped, 0) + sign
+                if count:
+                    self.completed_days[stopped] = count
+                else:
+                    del self.completed_days[stopped]
+
+    def update(self, old, new):
+        with self.lock:
+            if old is not None:
+                self._apply(old, -1)
+            if new is not None:
+                self._apply(new, 1)
+
+    def percentage(self):
+        with self.lock:
+            return rate(self.completed, self.total)
+
+    def detailed(self, today, trend_days=TREND_DAYS):
+        """Completion rates over rolling windows, per priority and per day,
+        read from the day buckets"""
+        days = [(today - timedelta(days=i)).isoformat() for i in range(max(max(WINDOWS), trend_days))]
+        with self.lock:
+            created = [self.created_days.get(day, (0, 0)) for day in days]
+            completed = [self.completed_days.get(day, 0) for day in days]
+
+            windows = {}
+            for length in WINDOWS:
+                total = sum(counts[0] for counts in created[:length])
+                done = sum(counts[1] for counts in created[:length])
+                windows[str(length)] = {
+                    "created_tasks": total,
+                    "completed_tasks": done,
+                    "completion_rate": rate(done, total),
+                    # Tasks finished in the window, whenever they were created
+                    "tasks_completed_in_window": sum(completed[:length]),
+                }
+
+            by_priority = {
+                priority: {"total_tasks": total, "completed_tasks": done, "completion_rate": rate(done, total)}
+                for priority, (total, done) in self.priorities.items()
+            }
+            percentage = rate(self.completed, self.total)
+
+        # Oldest day first: tasks created that day, the completion rate of
+        # those tasks and the tasks finished that day
+        daily = [
+            {
+                "date": days[i],
+                "created_tasks": created[i][0],
+                "completion_rate": rate(created[i][1], created[i][0]),
+                "tasks_completed": completed[i],
+            }
+            for i in reversed(range(trend_days))
+        ]
+        return {
+            "productivity_percentage": percentage,
+            "windows": windows,
+            "by_priority": by_priority,
+            "daily": daily,
+        }
+
+
+class UserCounters:
+    """ProductivityCounters for everyone and for each user_id, fed by one
+    listener. A task whose owner changes moves between users' counters."""
+
+    def __init__(self):
+        self.everyone = ProductivityCounters()
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def user(self, user_id):
+        """The counters of one user, empty ones for a user without tasks"""
+        with self.lock:
+            return self.users.get(str(user_id)) or ProductivityCounters()
+
+    def update(self, old, new):
+        self.everyone.update(old, new)
+        old_user = task_owner(old) if old is not None else None
+        new_user = task_owner(new) if new is not None else None
+        with self.lock:
+            if old_user == new_user:
+                if new_user is not None:
+                    self.users.setdefault(new_user, ProductivityCounters()).update(old, new)
+                return
+            if old_user is not None:
+                self.users[old_user].update(old, None)
+            if new_user is not None:
+                self.users.setdefault(new_user, ProductivityCounters()).update(None, new)
+
+
+# Counters bootstrapped from one export of the tasks and kept current from
+# the task_stats change feed, so /productivity never downloads the tasks
+counters = UserCounters()
+task_replica = TaskReplica(fields=TASK_FIELDS)
+task_replica.add_listener(counters.update)
+
+
 @app.route("/productivity", methods=["GET"])
 def productivity():
-    response = requests.get("http://task_stats:5001/view_tasks")
-    if response.ok:
-        tasks = response.json()["tasks"]
-        completed_tasks = sum(task.get("completed", False) for task in tasks)
-        total_tasks = len(tasks)
-        productivity_percentage = (completed_tasks / total_tasks) * 100 if total_tasks else 0
-        return jsonify({"productivity_percentage": productivity_percentage})
-    else:
+    # Apply the changes the background thread hasn't picked up yet (all of
+    # them on the first request), so a client that just changed a task
+    # sees the change counted
+    try:
+        task_replica.sync()
+    except requests.RequestException:
         return jsonify({"error": "Error fetching tasks from task_stats service"}), 500
 
+    # With user_id, only that user's tasks count
+    user = request.args.get("user_id")
+    scoped = counters.user(user) if user is not None else counters.everyone
+
+    # view=detailed adds rolling windows, per-priority rates and a daily
+    # trend; the default view is the all-time percentage
+    if request.args.get("view", "summary") == "detailed":
+        try:
+            trend_days = int(request.args.get("days", TREND_DAYS))
+        except ValueError:
+            return jsonify({"error": "days must be an integer"}), 400
+        if not 1 <= trend_days <= MAX_TREND_DAYS:
+            return jsonify({"error": f"days must be between 1 and {MAX_TREND_DAYS}"}), 400
+        return jsonify(scoped.detailed(date.today(), trend_days))
+
+    return jsonify({"productivity_percentage": scoped.percentage()})
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5004)
\ No newline at end of file
+    # Follow the change feed in the background
+    task_replica.start()
+    app.run(host="0.0.0.0", port=5004)
@@ -0,0 +1,158 @@
+import heapq
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+# Recent events kept for subscribers that reconnect with Last-Event-ID
+EVENT_HISTORY = 1000
+# Events buffered per subscriber before it is dropped as too slow
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class ReminderScheduler:
+    """Fires reminder events when pending tasks cross their due thresholds.
+
+    Every pending task with a due date has two thresholds: "due_soon" at
+    the start of the day horizon_days before it is due, matching the
+    default /reminders cutoff, and "overdue" at the end of its due date.
+    Future thresholds sit in a heap of (time, task_id, kind, generation)
+    and a timer thread sleeps until the earliest one, so scheduling and
+    firing cost O(log n) however many reminders are pending.
+
+    update(old, new) has the TaskReplica listener signature. A change to a
+    task gives it a new generation instead of searching the heap for its
+    old entries; entries whose generation is no longer current are skipped
+    when they come up, and the heap is rebuilt once they make up most of
+    it. A task that changes into the due_soon window fires right away,
+    unless due_soon was already sent for that task and due date: a replica
+    reload re-adds every task, and that shouldn't repeat its reminders.
+    Completing a task forgets its due_soon, so reopening it reminds again.
+
+    Events go to every subscriber's queue and to a short history, so a
+    subscriber can pick up where it left off after reconnecting.
+    """
+
+    def __init__(self, horizon_days=1):
+        self.horizon_days = horizon_days
+        self.heap = []
+        # task_id -> generation of its current heap entries
+        self.generations = {}
+        self.tasks = {}
+        self.generation = 0
+        # (task_id, due_date) pairs due_soon has been sent for
+        self.notified = set()
+        self.condition = threading.Condition()
+        self.history = deque(maxlen=EVENT_HISTORY)
+        self.next_event_id = 1
+        self.subscribers = set()
+
+    def _thresholds(self, task):
+        """(due_soon, overdue) times of a task, or None if it has none"""
+        if task is None or task.get("completed") or not task.get("due_date"):
+            return None
+        try:
+            due = datetime.strptime(task["due_date"], "%Y-%m-%d")
+        except (TypeError, ValueError):
+            return None
+        return (
+            (due - timedelta(days=self.horizon_days)).timestamp(),
+            (due + timedelta(days=1)).timestamp(),
+        )
+
+    def update(self, old, new):
+        """Reschedule a task that was added, changed or deleted"""
+        task_id = (new or old)["id"]
+        thresholds = self._thresholds(new)
+        with self.condition:
+            self.generation += 1
+            if thresholds is None:
+                self.generations.pop(task_id, None)
+                self.tasks.pop(task_id, None)
+                if new is not None and new.get("completed"):
+                    # Reopening it makes it pending again, worth a reminder.
+                    # Deletions keep theirs, since a reload looks like one.
+                    self.notified.discard((task_id, new.get("due_date")))
+                return
+            self.generations[task_id] = self.generation
+            self.tasks[task_id] = new
+
+            now = time.time()
+            due_soon, overdue = thresholds
+            if due_soon <= now < overdue and (task_id, new["due_date"]) not in self.notified:
+                self._publish("due_soon", new)
+            earliest = self.heap[0][0] if self.heap else None
+            for at, kind in ((due_soon, "due_soon"), (overdue, "overdue")):
+                if at > now:
+                    heapq.heappush(self.heap, (at, task_id, kind, self.generation))
+            if len(self.heap) > 2 * len(self.generations) + 1024:
+                self.heap = [entry for entry in self.heap if self._current(entry)]
+                heapq.heapify(self.heap)
+                # Due dates that have passed can't enter the window again
+                today = datetime.now().strftime("%Y-%m-%d")
+                self.notified = {entry for entry in self.notified if (entry[1] or "") >= today}
+            if self.heap and (earliest is None or self.heap[0][0] < earliest):
+                # Wake the timer thread to sleep until the new earliest entry
+                self.condition.notify_all()
+
+    def _current(self, entry):
+        return self.generations.get(entry[1]) == entry[3]
+
+    def _publish(self, kind, task):
+        """Send an event to every subscriber. Called with the lock held."""
+        if kind == "due_soon":
+            self.notified.add((task["id"], task.get("due_date")))
+        else:
+            self.notified.discard((task["id"], task.get("due_date")))
+        event = {"id": self.next_event_id, "kind": kind, "task": task,
+                 "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        self.next_event_id += 1
+        self.history.append(event)
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Too slow to keep up, it can reconnect with Last-Event-ID
+                self.subscribers.discard(subscriber)
+
+    def run(self):
+        with self.condition:
+            while True:
+                now = time.time()
+                while self.heap and self.heap[0][0] <= now:
+                    entry = heapq.heappop(self.heap)
+                    if self._current(entry):
+                        self._publish(entry[2], self.tasks[entry[1]])
+                self.condition.wait(self.heap[0][0] - now if self.heap else None)
+
+    def start(self):
+        """Fire reminders from a background timer thread"""
+        thread = threading.Thread(target=self.run, name="reminder-scheduler", daemon=True)
+        thread.start()
+        return thread
+
+    def subscribe(self, last_event_id=None):
+        """Queue receiving every event from now on, starting with the
+        events after last_event_id that are still in the history"""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.condition:
+            if last_event_id is not None:
+                for event in self.history:
+                    if event["id"] > last_event_id:
+                        subscriber.put_nowait(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.condition:
+            self.subscribers.discard(subscriber)
+
+    def is_subscribed(self, subscriber):
+        with self.condition:
+            return subscriber in self.subscribers
+
+    def scheduled(self):
+        """Number of pending tasks with reminders scheduled"""
+        with self.condition:
+            return len(self.generations)
@@ -1,40 +1,176 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from bisect import bisect_left, insort
 from datetime import datetime, timedelta
+import heapq
+import json
+import queue
+import threading
 import requests
+from reminder_scheduler import ReminderScheduler
+from task_client import TASK_STATS_URL, TaskReplica
+from task_store import task_owner
 
 app = Flask(__name__)
 
+# How far ahead /reminders looks by default, in days
+DEFAULT_HORIZON_DAYS = 1
+# Seconds between keep-alive comments on an idle /reminder_events stream
+HEARTBEAT_SECONDS = 15
+
+
+class DueDateIndex:
+    """Pending tasks with a due date, kept sorted by (due_date, id) in one
+    list per user (tasks without a user_id share the None list).
+
+    Due dates are YYYY-MM-DD strings, which sort like dates, so "due by
+    cutoff" is a binary search for the cutoff plus a scan of the k tasks
+    before it, in the user's list only when the query is for one user.
+    update(old, new) has the TaskReplica listener signature.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def update(self, old, new):
+        with self.lock:
+            if old is not None and old["id"] in self.tasks:
+                indexed = self.tasks.pop(old["id"])
+                user = task_owner(indexed)
+                entries = self.entries[user]
+                del entries[bisect_left(entries, (indexed["due_date"], old["id"]))]
+                if not entries:
+                    del self.entries[user]
+            # A due date that isn't a string (stored by an older version)
+            # can't be compared with the others, so it counts as none
+            due = new.get("due_date") if new is not None else None
+            if due and isinstance(due, str) and not new.get("completed"):
+                insort(self.entries.setdefault(task_owner(new), []), (new["due_date"], new["id"]))
+                self.tasks[new["id"]] = new
+
+    def due_by(self, cutoff, user=None):
+        """Pending tasks due on or before cutoff, soonest first, of one user
+        or of everyone"""
+        # (cutoff + "\0",) sorts after every (cutoff, id) entry
+        bound = (cutoff + "\0",)
+        with self.lock:
+            if user is not None:
+                entries = self.entries.get(str(user), [])
+                due = entries[:bisect_left(entries, bound)]
+            else:
+                due = heapq.merge(*(
+                    entries[:bisect_left(entries, bound)] for entries in self.entries.values()
+                ))
+            return [self.tasks[task_id] for _, task_id in due]
+
+
+# Local copy of the tasks, kept current from the task_stats change feed,
+# with its pending tasks indexed by due date and scheduled for reminders
+due_index = DueDateIndex()
+scheduler = ReminderScheduler(horizon_days=DEFAULT_HORIZON_DAYS)
+task_replica = TaskReplica()
+task_replica.add_listener(due_index.update)
+task_replica.add_listener(scheduler.update)
+
 @app.route("/reminders", methods=["GET"])
 def get_reminders():
-    response = requests.get("http://task_stats:5001/view_tasks")
-    if response.ok:
-        tasks = response.json()["tasks"]
-        upcoming_tasks = [
-            task for task in tasks 
-            if datetime.strptime(task["due_date"], "%Y-%m-%d") <= datetime.now() + timedelta(days=1)
-        ]
-        return jsonify({"upcoming_tasks": upcoming_tasks})
-    else:
+    # Pending tasks due within horizon_days from today, overdue ones
+    # included, of the user given by user_id or of everyone
+    try:
+        horizon_days = int(request.args.get("horizon_days", DEFAULT_HORIZON_DAYS))
+    except ValueError:
+        return jsonify({"error": "horizon_days must be an integer"}), 400
+    if horizon_days < 0:
+        return jsonify({"error": "horizon_days must not be negative"}), 400
+    cutoff = (datetime.now() + timedelta(days=horizon_days)).strftime("%Y-%m-%d")
+
+    # Bring the local copy of the tasks up to date with the changes made
+    # since the last request
+    try:
+        task_replica.sync()
+    except requests.RequestException:
         return jsonify({"error": "Error fetching tasks from task_stats service"}), 500
 
+    return jsonify({"upcoming_tasks": due_index.due_by(cutoff, user=request.args.get("user_id"))})
+
+@app.route("/reminder_events", methods=["GET"])
+def reminder_events():
+    # Server-sent events: one "due_soon" or "overdue" event whenever a
+    # pending task crosses a threshold. Clients that reconnect with
+    # Last-Event-ID get the recent events they missed.
+    # With user_id, only that user's tasks.
+    user = request.args.get("user_id")
+    last_event_id = request.headers.get("Last-Event-ID")
+    subscriber = scheduler.subscribe(int(last_event_id) if last_event_id and last_event_id.isdigit() else None)
+
+    def stream():
+        try:
+            # Something to send right away, so the response headers go out
+            # before the first event
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Dropped for falling behind; the client reconnects
+                    if not scheduler.is_subscribed(subscriber):
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if user is not None and task_owner(event["task"]) != user:
+                    continue
+                yield f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            scheduler.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.route("/mark_complete", methods=["POST"])
 def mark_complete():
+    # Several tasks can be completed at once by sending a list of ids
+    task_ids = request.json.get("ids")
+    if task_ids is not None:
+        if not isinstance(task_ids, list):
+            return jsonify({"error": "Expected a list of ids!"}), 400
+        return mark_many_complete(task_ids)
+
     task_id = request.json.get("id")
-    response = requests.get("http://task_stats:5001/view_tasks")
-    if response.ok:
-        tasks = response.json()["tasks"]
-        for task in tasks:
-            if task["id"] == task_id:
-                task["completed"] = True
-                task["stopped_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                update_response = requests.post("http://task_stats:5001/update_task", json=task)
-                if update_response.ok:
-                    return jsonify({"message": "Task marked as complete!"})
-                else:
-                    return jsonify({"error": "Error updating task in task_stats service"}), 500
+    # task_stats completes the task in place, and only if it isn't
+    # completed yet, so there is nothing to download and concurrent
+    # completes can't overwrite each other's stopped_at
+    update_response = requests.post(f"{TASK_STATS_URL}/complete_task", json={"id": task_id, "completed": True})
+    if update_response.ok:
+        return jsonify({"message": "Task marked as complete!"})
+    elif update_response.status_code == 404:
         return jsonify({"message": "Task not found!"}), 404
+    elif update_response.status_code == 409:
+        return jsonify({"message": "Task is already complete!"}), 409
     else:
-        return jsonify({"error": "Error fetching tasks from task_stats service"}), 500
+        return jsonify({"error": "Error updating task in task_stats service"}), 500
+
+def mark_many_complete(task_ids):
+    items = [{"id": task_id, "completed": True} for task_id in task_ids]
+    update_response = requests.post(f"{TASK_STATS_URL}/complete_tasks", json={"tasks": items})
+    if not update_response.ok:
+        return jsonify({"error": "Error updating tasks in task_stats service"}), 500
+    results = [
+        {key: result[key] for key in ("id", "status", "error") if key in result}
+        for result in update_response.json()["results"]
+    ]
+    # Always 200 like /complete_tasks, since some tasks may have been
+    # completed even if others weren't; the results say which
+    statuses = {result["status"] for result in results}
+    if statuses <= {"updated"}:
+        message = "Tasks marked as complete!"
+    elif statuses <= {"updated", "conflict"}:
+        message = "Some tasks were already complete!"
+    else:
+        message = "Some tasks could not be completed!"
+    return jsonify({"message": message, "results": results})
 
 if __name__ == "__main__":
+    # Follow the change feed and fire reminders in the background
+    task_replica.start()
+    scheduler.start()
     app.run(host="0.0.0.0", port=5002)
\ No newline at end of file
@@ -0,0 +1,106 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Title words count for more than description words when ranking
+FIELD_WEIGHTS = {"title": 2.0, "description": 1.0}
+# Score factor for words that only start with a query term
+PREFIX_WEIGHT = 0.5
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """Inverted index over task titles and descriptions.
+
+    postings maps every word to {task_id: weight}, where weight sums the
+    field weights of each occurrence in the task. The words are also kept
+    in a sorted list so a query term can match every word it is a prefix
+    of with a binary search instead of a scan of the vocabulary.
+
+    update(old, new) has the TaskReplica listener signature, so the index
+    is maintained incrementally from the replica's changes.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.words = []
+        # Weights of each indexed task's words, to unindex it again
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _weights(self, task):
+        weights = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for word in tokenize(task.get(field)):
+                weights[word] = weights.get(word, 0) + field_weight
+        return weights
+
+    def _remove(self, task_id):
+        for word in self.documents.pop(task_id, {}):
+            posting = self.postings[word]
+            del posting[task_id]
+            if not posting:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+
+    def update(self, old, new):
+        """Reindex a task that was added (old is None), changed or deleted
+        (new is None)"""
+        with self.lock:
+            if old is not None:
+                self._remove(old["id"])
+            if new is not None:
+                self._remove(new["id"])
+                weights = self._weights(new)
+                for word, weight in weights.items():
+                    posting = self.postings.get(word)
+                    if posting is None:
+                        posting = self.postings[word] = {}
+                        insort(self.words, word)
+                    posting[new["id"]] = weight
+                self.documents[new["id"]] = weights
+
+    def _matches(self, term):
+        """Words equal to or starting with term, with their score factor"""
+        words = self.words
+        # Walk the sorted words from the first candidate instead of slicing,
+        # so a lookup costs O(log V + matches)
+        for i in range(bisect_left(words, term), len(words)):
+            word = words[i]
+            if not word.startswith(term):
+                break
+            yield word, 1.0 if word == term else PREFIX_WEIGHT
+
+    def search(self, text):
+        """Return {task_id: score} for the tasks containing every term of
+        text, either as a word or as the prefix of one. Rarer words score
+        higher (tf-idf)."""
+        terms = set(tokenize(text))
+        if not terms:
+            return {}
+        with self.lock:
+            total = len(self.documents)
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for word, factor in self._matches(term):
+                    posting = self.postings[word]
+                    idf = math.log(1 + total / len(posting))
+                    for task_id, weight in posting.items():
+                        term_scores[task_id] = term_scores.get(task_id, 0) + weight * idf * factor
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {task_id: score + term_scores[task_id]
+                              for task_id, score in scores.items() if task_id in term_scores}
+                if not scores:
+                    return {}
+            return scores
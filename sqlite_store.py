@@ -0,0 +1,358 @@
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from task_store import ChangeLog, completion_changes, completion_seconds, index_key, normalize_task, parse_date, task_owner
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    priority TEXT,
+    completed INTEGER NOT NULL,
+    due_date,
+    completion_seconds REAL,
+    data TEXT NOT NULL,
+    user_id TEXT
+);
+-- The last position handed out. Positions only ever increase, so a new
+-- task never reuses the position of a deleted one that a cursor may hold.
+CREATE TABLE IF NOT EXISTS position_counter (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    position INTEGER NOT NULL
+);
+"""
+
+# Created after databases from before user_id existed get the column.
+# Every index has a per-user twin so a user's queries only read that
+# user's rows.
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS tasks_position ON tasks (position);
+CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (priority, completed);
+CREATE INDEX IF NOT EXISTS tasks_completed ON tasks (completed, completion_seconds);
+CREATE INDEX IF NOT EXISTS tasks_due_date ON tasks (due_date);
+CREATE INDEX IF NOT EXISTS tasks_user_position ON tasks (user_id, position);
+CREATE INDEX IF NOT EXISTS tasks_user_priority ON tasks (user_id, priority, completed);
+CREATE INDEX IF NOT EXISTS tasks_user_completed ON tasks (user_id, completed, completion_seconds);
+CREATE INDEX IF NOT EXISTS tasks_user_due_date ON tasks (user_id, due_date);
+"""
+
+# Query parameters accepted by find/count, mapped to their columns
+CRITERIA_COLUMNS = {
+    "priority": "priority",
+    "completed": "completed",
+    "due_date": "due_date",
+}
+
+
+class ConnectionPool:
+    """Reusable connections to one SQLite database.
+
+    Flask's threaded server runs every request on a new thread, so
+    per-thread connections would be opened, configured and given an empty
+    statement cache for each request. Connections are borrowed from here
+    instead and returned after use, keeping up to size idle ones with
+    their prepared statements.
+    """
+
+    def __init__(self, path, size=8, cached_statements=256):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection. Results must be fetched before the block
+        ends, the connection goes to the next borrower after it."""
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            try:
+                self.idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+class SqliteTaskStore:
+    """TaskStore backed by a SQLite database.
+
+    Has the same interface as task_store.TaskStore. The full task is kept
+    as JSON in the data column, and the indexed fields are copied into
+    their own columns so lookups and the /stats and /task_summary
+    aggregates run as indexed SQL queries. Connections come from a
+    ConnectionPool; the database runs in WAL mode so reads don't block the
+    writer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pool = ConnectionPool(path)
+        # Serializes writers within this process so read-modify-write
+        # updates can't interleave
+        self.lock = threading.RLock()
+        # Recent changes, also the store version used for ETags. Changes
+        # are recorded once their transaction commits.
+        self.changes = ChangeLog()
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+            if "user_id" not in columns:
+                conn.execute("ALTER TABLE tasks ADD COLUMN user_id TEXT")
+            conn.executescript(INDEXES)
+            # Databases from before the counter continue after their newest task
+            conn.execute(
+                "INSERT OR IGNORE INTO position_counter (id, position) "
+                "SELECT 0, COALESCE(MAX(position), 0) FROM tasks"
+            )
+
+    def _query(self, sql, params=()):
+        """Run a read query on a pooled connection and return all rows"""
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM tasks")[0][0]
+
+    @property
+    def version(self):
+        return self.changes.version
+
+    def _row(self, task):
+        return (
+            task["id"],
+            index_key(task, "priority"),
+            int(index_key(task, "completed")),
+            index_key(task, "due_date"),
+            completion_seconds(task),
+            json.dumps(task, separators=(",", ":")),
+            task_owner(task),
+        )
+
+    def add(self, task):
+        """Insert a task, replacing any existing task with the same id"""
+        return self.add_many([task])[0]
+
+    def add_many(self, tasks):
+        """Insert several tasks in one transaction"""
+        tasks = [normalize_task(task) for task in tasks]
+        with self._transaction() as (conn, changes):
+            for task in tasks:
+                conn.execute("DELETE FROM tasks WHERE id = ?", (task["id"],))
+                conn.execute("UPDATE position_counter SET position = position + 1")
+                conn.execute(
+                    "INSERT INTO tasks (id, position, priority, completed, due_date, completion_seconds, data, user_id) "
+                    "VALUES (?1, (SELECT position FROM position_counter), ?2, ?3, ?4, ?5, ?6, ?7)",
+                    self._row(task),
+                )
+                changes.append(("add", task["id"], task))
+        return tasks
+
+    def get(self, task_id):
+        rows = self._query("SELECT data FROM tasks WHERE id = ?", (task_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def update(self, task_id, changes):
+        """Apply changes to a task, returns None if it doesn't exist"""
+        return self.update_many([dict(changes, id=task_id)])[0]
+
+    def update_many(self, updates):
+        """Apply a list of changes, each holding the id of the task to
+        change, in one transaction. Returns the updated tasks, with None
+        for missing ids."""
+        results = []
+        with self._transaction() as (conn, changes):
+            for update in updates:
+                update = normalize_task(update)
+                row = conn.execute("SELECT data FROM tasks WHERE id = ?", (update["id"],)).fetchone()
+                if row is None:
+                    results.append(None)
+                    continue
+                task = json.loads(row[0])
+                task.update(update)
+                conn.execute(
+                    "UPDATE tasks SET priority = ?2, completed = ?3, due_date = ?4, "
+                    "completion_seconds = ?5, data = ?6, user_id = ?7 WHERE id = ?1",
+                    self._row(task),
+                )
+                changes.append(("update", task["id"], task))
+                results.append(task)
+        return results
+
+    def set_completed_many(self, items):
+        """Complete or reopen several tasks with compare-and-set in one
+        transaction, see TaskStore.set_completed_many"""
+        results = []
+        with self._transaction() as (conn, changes):
+            for item in items:
+                update = completion_changes(item)
+                row = conn.execute("SELECT data FROM tasks WHERE id = ?", (update["id"],)).fetchone()
+                if row is None:
+                    results.append(("not_found", None))
+                    continue
+                task = json.loads(row[0])
+                if bool(task.get("completed")) != item.get("expected", not update["completed"]):
+                    results.append(("conflict", task))
+                    continue
+                task.update(update)
+                conn.execute(
+                    "UPDATE tasks SET priority = ?2, completed = ?3, due_date = ?4, "
+                    "completion_seconds = ?5, data = ?6, user_id = ?7 WHERE id = ?1",
+                    self._row(task),
+                )
+                changes.append(("update", task["id"], task))
+                results.append(("updated", task))
+        return results
+
+    def delete(self, task_id):
+        """Remove a task, returns the removed task or None"""
+        return self.delete_many([task_id])[0]
+
+    def delete_many(self, task_ids):
+        """Remove several tasks in one transaction, returns the removed
+        tasks with None for missing ids"""
+        results = []
+        with self._transaction() as (conn, changes):
+            for task_id in task_ids:
+                row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                if row is None:
+                    results.append(None)
+                    continue
+                conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+                changes.append(("delete", task_id, None))
+                results.append(json.loads(row[0]))
+        return results
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction. Yields the connection and a list the
+        caller appends its (op, id, task) changes to."""
+        with self.lock, self.pool.connection() as conn:
+            changes = []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn, changes
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            for op, task_id, task in changes:
+                self.changes.record(op, task_id, task)
+
+    def all(self):
+        rows = self._query("SELECT data FROM tasks ORDER BY position")
+        return [json.loads(data) for data, in rows]
+
+    def page(self, after=None, limit=None, user=None):
+        """Return up to limit tasks added after the cursor position, and the
+        cursor for the next page (None when there are no more tasks)"""
+        where, params = self._where({}, user, after)
+        if limit is None:
+            rows = self._query(f"SELECT position, data FROM tasks{where} ORDER BY position", params)
+        else:
+            # Fetch one extra row to find out whether there is another page
+            rows = self._query(
+                f"SELECT position, data FROM tasks{where} ORDER BY position LIMIT ?", params + [limit + 1]
+            )
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0] if rows else None
+        return [json.loads(data) for _, data in rows], next_cursor
+
+    def _where(self, criteria, user=None, after=None, ids=None):
+        clauses, params = [], []
+        if user is not None:
+            clauses.append("user_id = ?")
+            params.append(str(user))
+        if ids is not None:
+            ids = list(ids)
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})" if ids else "0")
+            params.extend(ids)
+        if after is not None:
+            clauses.append("position > ?")
+            params.append(after)
+        for field, value in criteria.items():
+            if value is None:
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            if field == "completed":
+                values = [int(bool(item)) for item in values]
+            elif field == "due_date":
+                values = [parse_date(item) for item in values]
+            if len(values) == 1:
+                clauses.append(f"{CRITERIA_COLUMNS[field]} = ?")
+            else:
+                clauses.append(f"{CRITERIA_COLUMNS[field]} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def count(self, user=None, **criteria):
+        """Count tasks matching the given index criteria"""
+        where, params = self._where(criteria, user)
+        return self._query(f"SELECT COUNT(*) FROM tasks{where}", params)[0][0]
+
+    def find(self, user=None, ids=None, **criteria):
+        """Return tasks whose indexed fields match every given criterion,
+        in insertion order. A criterion can be a list to match any of its
+        values. Criteria with a value of None are ignored. ids, if given,
+        limits the result to those tasks."""
+        where, params = self._where(criteria, user, ids=ids)
+        rows = self._query(f"SELECT data FROM tasks{where} ORDER BY position", params)
+        return [json.loads(data) for data, in rows]
+
+    def stats(self, user=None):
+        """Task counts and completion time totals for /stats"""
+        where, params = self._where({}, user)
+        completed_where, completed_params = self._where({"completed": True}, user)
+        # One connection, so both counts come from the same read
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN")
+            total = conn.execute(f"SELECT COUNT(*) FROM tasks{where}", params).fetchone()[0]
+            completed, completion_total, completion_count = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(completion_seconds), 0), COUNT(completion_seconds) "
+                f"FROM tasks{completed_where}", completed_params
+            ).fetchone()
+            conn.execute("COMMIT")
+        return {
+            "total_tasks": total,
+            "completed_tasks": completed,
+            "pending_tasks": total - completed,
+            "completion_time_total": completion_total,
+            "completion_time_count": completion_count,
+        }
+
+    def summary(self, user=None):
+        """Completed/not completed counts per priority for /task_summary"""
+        summary = {}
+        where, params = self._where({}, user)
+        rows = self._query(
+            f"SELECT priority, completed, COUNT(*) FROM tasks{where} GROUP BY priority, completed", params
+        )
+        for priority, completed, count in rows:
+            counts = summary.setdefault(priority, {"completed": 0, "not_completed": 0})
+            counts["completed" if completed else "not_completed"] = count
+        return summary
+
+    def completion_times(self, user=None):
+        """Completion seconds of completed tasks, in task order"""
+        where, params = self._where({"completed": True}, user)
+        rows = self._query(
+            f"SELECT completion_seconds FROM tasks{where} AND completion_seconds IS NOT NULL "
+            "ORDER BY position", params
+        )
+        return [seconds for seconds, in rows]
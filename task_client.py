@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+import requests
+
+# Shared helpers for services that read tasks from the task_stats service
+TASK_STATS_URL = "http://task_stats:5001"
+
+# Bodies of recent GET requests with their ETags, so unchanged resources can
+# be revalidated with If-None-Match instead of downloaded again
+CACHE_SIZE = 128
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def stream_tasks(fields=None, base_url=TASK_STATS_URL, timeout=None):
+    """Yield every task from the task_stats NDJSON export as it arrives.
+
+    Only one line is held in memory at a time, so this is the cheapest way
+    to walk every task. Raises requests.RequestException on errors.
+    """
+    params = {"fields": ",".join(fields)} if fields else None
+    response = fetch_if_changed("/export_tasks", params=params, stream=True, base_url=base_url, timeout=timeout)
+    yield from read_ndjson(response)
+
+
+def read_ndjson(response):
+    """Yield the JSON objects of a streamed NDJSON response one at a time"""
+    with response:
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def fetch_if_changed(path, etag=None, params=None, stream=False, base_url=TASK_STATS_URL, timeout=None):
+    """Conditional GET against task_stats.
+
+    Returns None if the resource still matches etag, otherwise the response
+    (whose ETag header identifies the new version). timeout is passed on to
+    requests. Raises requests.RequestException on errors, timeouts included.
+    """
+    headers = {"If-None-Match": etag} if etag else None
+    response = requests.get(f"{base_url}{path}", params=params, headers=headers, stream=stream, timeout=timeout)
+    if response.status_code == 304:
+        response.close()
+        return None
+    response.raise_for_status()
+    return response
+
+
+def get_json(path, params=None, base_url=TASK_STATS_URL, timeout=None):
+    """GET a JSON resource from task_stats, reusing the last body received
+    for the same request while task_stats answers 304 Not Modified"""
+    key = (base_url, path, tuple(sorted((params or {}).items())))
+    with _cache_lock:
+        etag, data = _cache.get(key, (None, None))
+    response = fetch_if_changed(path, etag=etag, params=params, base_url=base_url, timeout=timeout)
+    if response is not None:
+        etag, data = response.headers.get("ETag"), response.json()
+    with _cache_lock:
+        if etag:
+            _cache[key] = (etag, data)
+            _cache.move_to_end(key)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return data
+
+
+class TaskReplica:
+    """Local copy of the tasks in task_stats, kept current from /changes.
+
+    sync() applies the changes made since the last sync, so staying current
+    costs O(changes) rather than a full download. Every task is reloaded
+    only when the change log can't cover the gap: on the first sync, after
+    task_stats restarts, or when the replica falls too far behind.
+
+    Listeners registered with add_listener are called as listener(old, new)
+    for every task that changes; old is None for added tasks and new is
+    None for deleted ones.
+    """
+
+    def __init__(self, fields=None, base_url=TASK_STATS_URL):
+        self.fields = fields
+        self.base_url = base_url
+        self.tasks = {}
+        self.version = None
+        self.instance = None
+        self.listeners = []
+        self.lock = threading.RLock()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def values(self):
+        """List of the replicated tasks, in task_stats order"""
+        with self.lock:
+            return list(self.tasks.values())
+
+    def _project(self, task):
+        if self.fields is None:
+            return task
+        projected = {field: task[field] for field in self.fields if field in task}
+        projected["id"] = task["id"]
+        return projected
+
+    def _set(self, task_id, task):
+        old = self.tasks.pop(task_id, None) if task is None else self.tasks.get(task_id)
+        if task is not None:
+            self.tasks[task_id] = task
+        if old is not None or task is not None:
+            for listener in self.listeners:
+                listener(old, task)
+
+    def sync(self, timeout=0):
+        """Bring the replica up to date. With timeout, waits up to that many
+        seconds for a change first. Raises requests.RequestException if
+        task_stats can't be reached."""
+        if self.version is None:
+            return self.reload()
+        response = requests.get(
+            f"{self.base_url}/changes",
+            params={"since": self.version, "timeout": timeout},
+            timeout=timeout + 10
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data["reset"] or data["instance"] != self.instance:
+            return self.reload()
+
+        with self.lock:
+            for change in data["changes"]:
+                # Another thread may already have applied newer changes
+                if change["version"] <= self.version:
+                    continue
+                if change["op"] == "delete":
+                    self._set(change["id"], None)
+                else:
+                    self._set(change["id"], self._project(change["task"]))
+                self.version = change["version"]
+
+    def reload(self):
+        """Replace the replica with a fresh copy of every task"""
+        response = requests.get(f"{self.base_url}/version")
+        response.raise_for_status()
+        current = response.json()
+        # Changes made during the export are applied again by the next sync,
+        # which is harmless since each change carries the whole task
+        fields = ["id", *self.fields] if self.fields else None
+        tasks = {task["id"]: task for task in stream_tasks(fields, base_url=self.base_url)}
+
+        with self.lock:
+            old_tasks, self.tasks = self.tasks, {}
+            for old in old_tasks.values():
+                for listener in self.listeners:
+                    listener(old, None)
+            for task_id, task in tasks.items():
+                self._set(task_id, self._project(task))
+            self.version = current["version"]
+            self.instance = current["instance"]
+
+    def start(self, poll_timeout=25):
+        """Keep the replica current from a background long-poll thread"""
+        def run():
+            while True:
+                try:
+                    self.sync(timeout=poll_timeout)
+                except requests.RequestException:
+                    time.sleep(1)
+
+        thread = threading.Thread(target=run, name="task-replica", daemon=True)
+        thread.start()
+        return thread
@@ -1,141 +1,322 @@
 from flask import Flask, request, jsonify
 import requests
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
+from collections import OrderedDict, namedtuple
+from itertools import islice
+import heapq
 import os
+import re
+import threading
+from preference_store import DEFAULT_NAME, DEFAULT_USER, PreferenceStore, check_name
+from search_index import SearchIndex, tokenize
+from task_client import TaskReplica, fetch_if_changed, get_json
 
 app = Flask(__name__)
 
-# Path to the JSON file
+# Filter preferences, one file per user. PREFERENCES_FILE is the single
+# file used before, imported for the default user on startup.
+PREFERENCES_DIR = os.environ.get("PREFERENCES_DIR", "/app/data/filter_preferences")
 PREFERENCES_FILE = "/app/data/filter_preferences.json"
+preference_store = PreferenceStore(PREFERENCES_DIR)
 
-def load_preferences():
-    """Load preferences from JSON file, create if doesn't exist"""
-    try:
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(PREFERENCES_FILE), exist_ok=True)
-        
-        if not os.path.exists(PREFERENCES_FILE):
-            # Create with proper permissions
-            with open(PREFERENCES_FILE, 'w') as f:
-                json.dump({"saved_preferences": []}, f, indent=4)
-            # Set file permissions
-            os.chmod(PREFERENCES_FILE, 0o666)
-        
-        with open(PREFERENCES_FILE, 'r') as f:
-            data = json.load(f)
-            print(f"Loaded preferences: {data}")  # Debug log
-            return data
-    except Exception as e:
-        print(f"Error loading preferences: {str(e)}")  # Debug log
-        return {"saved_preferences": []}
-
-def save_preferences(preferences_data):
-    """Save preferences to JSON file"""
+
+PRIORITIES = ("high", "medium", "low")
+# Rank used to sort by priority, most urgent first
+PRIORITY_RANK = {priority: rank for rank, priority in enumerate(PRIORITIES)}
+SORT_FIELDS = ("due_date", "priority", "created_at")
+# Due dates that compare as dates; anything else ("" for tasks without one,
+# or a value task_stats couldn't parse) counts as no due date
+ISO_DAY = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# A compiled /filter_tasks query. key identifies it in the result cache,
+# params are the filters task_stats can look up in its indexes, predicate
+# is a single function for the remaining filters (None if there are none)
+# and sort_key/descending/limit order and cut the result. search is the
+# full-text query, or None.
+Query = namedtuple("Query", "key params predicate sort_key descending limit search")
+
+# Full-text index over task titles and descriptions, kept in sync with
+# task_stats through a replica of just those fields
+search_index = SearchIndex()
+task_replica = TaskReplica(fields=["title", "description"])
+task_replica.add_listener(search_index.update)
+
+# Results of recent queries, keyed by the normalised query plus the
+# task_stats version they were computed at, so any write upstream makes
+# the old entries unreachable and they age out of the LRU
+RESULT_CACHE_SIZE = 256
+result_cache = OrderedDict()
+result_cache_lock = threading.Lock()
+cache_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Most search matches looked up per /query_tasks request, so the ids fit
+# in the URL
+MAX_IDS_PER_QUERY = 200
+
+
+def parse_day(value, name):
+    """Validate a YYYY-MM-DD parameter and return it as an ISO string"""
     try:
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(PREFERENCES_FILE), exist_ok=True)
-        
-        with open(PREFERENCES_FILE, 'w') as f:
-            json.dump(preferences_data, f, indent=4)
-        # Set file permissions
-        os.chmod(PREFERENCES_FILE, 0o666)
-        
-        print(f"Saved preferences: {preferences_data}")  # Debug log
-        return True
-    except Exception as e:
-        print(f"Error saving preferences: {str(e)}")  # Debug log
-        return False
+        return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date format for {name}")
 
-@app.route("/filter_tasks", methods=["GET"])
-def filter_tasks():
-    # Get filter parameters
-    priority = request.args.get("priority")
-    due_date = request.args.get("due_date")
-    completed = request.args.get("completed")
-    
-    # Get all tasks
-    response = requests.get("http://task_stats:5001/view_tasks")
-    if not response.ok:
-        return jsonify({"error": "Error fetching tasks from task_stats service"}), 500
-    
-    tasks = response.json()["tasks"]
-    filtered_tasks = tasks
 
-    # Apply priority filter if specified
+def task_due_date(task):
+    """The task's due date as a YYYY-MM-DD string, or None if it has none"""
+    due = task.get("due_date")
+    return due if isinstance(due, str) and ISO_DAY.fullmatch(due) else None
+
+
+def compile_query(args):
+    """Turn the /filter_tasks parameters into a query, validating them once.
+
+    Returns a Query. Raises ValueError for invalid parameters.
+    """
+    params = {}
+    priority = args.get("priority")
     if priority and priority != "all":
-        filtered_tasks = [task for task in filtered_tasks if task.get("priority") == priority]
-    
-    # Apply completion status filter if specified
+        priorities = [p.strip() for p in priority.split(",") if p.strip()]
+        if any(p not in PRIORITY_RANK for p in priorities):
+            raise ValueError("Invalid priority")
+        params["priority"] = ",".join(priorities)
+    completed = args.get("completed")
     if completed is not None:
-        completed_bool = completed.lower() == "true"
-        filtered_tasks = [task for task in filtered_tasks if task.get("completed") == completed_bool]
-    
-    # Apply due date filter if specified
-    if due_date:
+        params["completed"] = "true" if completed.lower() == "true" else "false"
+    if args.get("due_date"):
+        params["due_date"] = parse_day(args["due_date"], "due_date")
+    # Only one user's tasks, filtered by task_stats in that user's partition
+    if args.get("user_id"):
+        params["user_id"] = args["user_id"]
+
+    # Due dates are ISO strings, so ranges compare them as plain strings
+    # against bounds computed here rather than parsing every task's date
+    today = datetime.now().date()
+    due_from = parse_day(args["due_from"], "due_from") if args.get("due_from") else None
+    due_to = parse_day(args["due_to"], "due_to") if args.get("due_to") else None
+    if args.get("due_within_days"):
         try:
-            due_date = datetime.strptime(due_date, "%Y-%m-%d").date()
-            filtered_tasks = [
-                task for task in filtered_tasks 
-                if datetime.strptime(task.get("due_date", ""), "%Y-%m-%d").date() == due_date
-            ]
+            days = int(args["due_within_days"])
         except ValueError:
-            return jsonify({"error": "Invalid date format"}), 400
+            raise ValueError("due_within_days must be an integer")
+        if days < 0:
+            raise ValueError("due_within_days must not be negative")
+        due_from = max(due_from or "", today.isoformat())
+        due_to = min(due_to or "9999-12-31", (today + timedelta(days=days)).isoformat())
+    overdue = args.get("overdue", "").lower() == "true"
+    if overdue:
+        # Overdue means due before today and not done yet
+        before = (today - timedelta(days=1)).isoformat()
+        due_to = min(due_to or "9999-12-31", before)
+        params["completed"] = "false"
+
+    predicate = None
+    if due_from is not None or due_to is not None:
+        low = due_from or ""
+        high = due_to or "9999-12-31"
+
+        def predicate(task):
+            due = task_due_date(task)
+            return due is not None and low <= due <= high
+
+    sort = args.get("sort")
+    sort_key = None
+    if sort:
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+        if sort == "priority":
+            def sort_key(task):
+                rank = PRIORITY_RANK.get(task.get("priority"))
+                return (rank is None, rank or 0)
+        elif sort == "due_date":
+            def sort_key(task):
+                due = task_due_date(task)
+                return (due is None, due or "")
+        else:
+            def sort_key(task):
+                value = task.get(sort)
+                return (not value, value or "")
+    order = args.get("order", "asc")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+
+    limit = args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if limit < 0:
+            raise ValueError("limit must not be negative")
+
+    terms = tuple(sorted(set(tokenize(args.get("search")))))
+    search = " ".join(terms) or None
+    # Equivalent parameters (e.g. "high,medium" and "medium, high", or a
+    # relative range and the dates it resolves to) share a key
+    key = (
+        tuple(sorted(
+            (name, tuple(sorted(value.split(","))) if name == "priority" else value)
+            for name, value in params.items()
+        )),
+        due_from, due_to, sort, order, limit, search,
+    )
+    return Query(key, params, predicate, sort_key, order == "desc", limit, search)
+
+
+def run_query(tasks, query, scores=None):
+    """Filter, sort and limit tasks in one pass over them. scores holds the
+    search ranking; only tasks in it are kept, best matches first unless
+    the query has its own sort."""
+    predicate, sort_key, descending, limit = query.predicate, query.sort_key, query.descending, query.limit
+    if scores is not None:
+        tasks = (task for task in tasks if task["id"] in scores)
+        if sort_key is None:
+            def sort_key(task):
+                return (False, -scores[task["id"]])
+            descending = False
+    if predicate is not None:
+        tasks = filter(predicate, tasks)
+    if sort_key is None:
+        return list(tasks if limit is None else islice(tasks, limit))
+    if descending:
+        # Tasks without a value still sort last
+        ascending_key = sort_key
+
+        def sort_key(task):
+            missing, value = ascending_key(task)
+            return (not missing, value)
+    if limit is None:
+        return sorted(tasks, key=sort_key, reverse=descending)
+    # Top-K with a heap, so "next 20 due" doesn't sort every match
+    select = heapq.nlargest if descending else heapq.nsmallest
+    return select(limit, tasks, key=sort_key)
+
+
+def query_matches(params, task_ids):
+    """The tasks among task_ids that also match the index filters in
+    params, looked up by id in task_stats a chunk of ids at a time"""
+    tasks = []
+    for start in range(0, len(task_ids), MAX_IDS_PER_QUERY):
+        chunk = [str(task_id) for task_id in task_ids[start:start + MAX_IDS_PER_QUERY]]
+        # Not revalidated through get_json: each chunk is only fetched for
+        # a result cache miss, so its body wouldn't be asked for again
+        tasks.extend(fetch_if_changed("/query_tasks", params=dict(params, id=chunk)).json()["tasks"])
+    return tasks
+
+
+def cached_result(key):
+    with result_cache_lock:
+        result = result_cache.get(key)
+        if result is None:
+            cache_counters["misses"] += 1
+            return None
+        cache_counters["hits"] += 1
+        result_cache.move_to_end(key)
+        return result
+
+
+def cache_result(key, result):
+    with result_cache_lock:
+        result_cache[key] = result
+        result_cache.move_to_end(key)
+        while len(result_cache) > RESULT_CACHE_SIZE:
+            result_cache.popitem(last=False)
+            cache_counters["evictions"] += 1
+
+
+@app.route("/filter_tasks", methods=["GET"])
+def filter_tasks():
+    try:
+        query = compile_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # A repeated query at the same upstream version is answered from
+        # the cache without fetching or filtering any tasks. The version is
+        # read first, so a write racing the fetch can only file a newer
+        # result under an older version, never the other way round.
+        version = get_json("/version")
+        key = (version["instance"], version["version"], query.key)
+        filtered_tasks = cached_result(key)
+        if filtered_tasks is None:
+            # Push the indexed filters down to task_stats, which looks them
+            # up in its indexes and only sends back the matching tasks
+            if query.search:
+                # Bring the index up to at least the version read above,
+                # then only fetch its matches
+                task_replica.sync()
+                scores = search_index.search(query.search)
+                tasks = query_matches(query.params, list(scores))
+            else:
+                scores = None
+                tasks = get_json("/query_tasks", params=query.params)["tasks"]
+            filtered_tasks = run_query(tasks, query, scores)
+            cache_result(key, filtered_tasks)
+    except requests.RequestException:
+        return jsonify({"error": "Error fetching tasks from task_stats service"}), 500
 
     return jsonify({"filtered_tasks": filtered_tasks})
 
+@app.route("/filter_cache_stats", methods=["GET"])
+def filter_cache_stats():
+    with result_cache_lock:
+        return jsonify(dict(cache_counters, size=len(result_cache), max_size=RESULT_CACHE_SIZE))
+
+def preference_owner(source):
+    """User and preference name of a preferences request, from the JSON
+    body or the query string. Raises ValueError for invalid names."""
+    user = check_name(source.get("user", DEFAULT_USER), "user")
+    name = source.get("name")
+    return user, check_name(name, "preference") if name is not None else None
+
 @app.route("/save_filter_preferences", methods=["POST"])
 def save_filter_preferences():
+    new_preferences = request.get_json(silent=True)
+    if not new_preferences or not isinstance(new_preferences, dict):
+        return jsonify({"error": "No preferences provided"}), 400
     try:
-        new_preferences = request.json
-        if not new_preferences:
-            return jsonify({"error": "No preferences provided"}), 400
-
-        print(f"Received preferences: {new_preferences}")  # Debug log
-
-        # Add timestamp to preferences
-        new_preferences["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Save only the new preference (overwrite existing)
-        preferences_data = {"saved_preferences": [new_preferences]}
-        
-        # Save updated preferences
-        if save_preferences(preferences_data):
-            return jsonify({"message": "Filter preferences saved successfully"})
-        else:
-            return jsonify({"error": "Failed to save preferences"}), 500
-    
-    except Exception as e:
-        print(f"Error in save_filter_preferences: {str(e)}")  # Debug log
-        return jsonify({"error": f"Error saving preferences: {str(e)}"}), 500
+        user, name = preference_owner(new_preferences)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    preference = {key: value for key, value in new_preferences.items() if key not in ("user", "name")}
+    preference["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        preference_store.save(user, name or DEFAULT_NAME, preference)
+    except OSError as e:
+        print(f"Error saving preferences: {e}")
+        return jsonify({"error": "Failed to save preferences"}), 500
+    return jsonify({"message": "Filter preferences saved successfully"})
 
 @app.route("/get_saved_preferences", methods=["GET"])
 def get_saved_preferences():
+    # The user's preferences, most recently saved first
     try:
-        preferences_data = load_preferences()
-        print(f"Retrieved preferences: {preferences_data}")  # Debug log
-        return jsonify(preferences_data)
-    except Exception as e:
-        print(f"Error in get_saved_preferences: {str(e)}")  # Debug log
+        user, name = preference_owner(request.args)
+        return jsonify({"saved_preferences": preference_store.get(user, name)})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        print(f"Error loading preferences: {e}")
         return jsonify({"error": f"Error loading preferences: {str(e)}"}), 500
 
 @app.route("/clear_preferences", methods=["POST"])
 def clear_preferences():
+    # Clears the named preference, or all of the user's preferences
+    body = request.get_json(silent=True)
+    if body is not None and not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
     try:
-        if save_preferences({"saved_preferences": []}):
-            return jsonify({"message": "Preferences cleared successfully"})
-        else:
-            return jsonify({"error": "Failed to clear preferences"}), 500
-    except Exception as e:
-        print(f"Error in clear_preferences: {str(e)}")  # Debug log
-        return jsonify({"error": f"Error clearing preferences: {str(e)}"}), 500
+        user, name = preference_owner(body or request.args)
+        preference_store.clear(user, name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError as e:
+        print(f"Error clearing preferences: {e}")
+        return jsonify({"error": "Failed to clear preferences"}), 500
+    return jsonify({"message": "Preferences cleared successfully"})
 
 if __name__ == "__main__":
-    # Initialize preferences file with proper permissions
-    if not os.path.exists(PREFERENCES_FILE):
-        os.makedirs(os.path.dirname(PREFERENCES_FILE), exist_ok=True)
-        with open(PREFERENCES_FILE, 'w') as f:
-            json.dump({"saved_preferences": []}, f, indent=4)
-        os.chmod(PREFERENCES_FILE, 0o666)
-    
-    app.run(host="0.0.0.0", port=5003)
\ No newline at end of file
+    preference_store.import_file(PREFERENCES_FILE)
+    app.run(host="0.0.0.0", port=5003)
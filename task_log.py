@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+
+SNAPSHOT_PREFIX = "snapshot-"
+SEGMENT_PREFIX = "log-"
+SUFFIX = ".jsonl"
+
+
+def _file_seq(name, prefix):
+    """Sequence number encoded in a snapshot or log segment file name"""
+    if name.startswith(prefix) and name.endswith(SUFFIX):
+        try:
+            return int(name[len(prefix):-len(SUFFIX)])
+        except ValueError:
+            return None
+    return None
+
+
+class TaskLog:
+    """Write-ahead log with background snapshots for a TaskStore.
+
+    Every add/update/delete is appended to the current log segment as one
+    JSON line. A flusher thread fsyncs whatever has been appended and wakes
+    the writers waiting on it, so concurrent writes share a single fsync
+    (group commit).
+
+    Once snapshot_every records have been written since the last snapshot,
+    a background thread rotates to a new segment, writes the store to
+    snapshot-<seq>.jsonl and removes the segments the snapshot covers.
+    Startup replays the newest snapshot plus the segments after it, so
+    recovery only has to read at most snapshot_every log records on top of
+    the snapshot.
+    """
+
+    def __init__(self, directory, snapshot_every=100000):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.lock = threading.Lock()
+        # Held while fsyncing a segment so it can't be closed underneath
+        self.io_lock = threading.Lock()
+        self.synced = threading.Condition(self.lock)
+        self.store = None
+        self.segment = None
+        self.seq = 0
+        self.synced_seq = 0
+        self.snapshot_seq = 0
+        # No snapshot is started before this sequence number, set after a
+        # snapshot fails so a lasting error isn't retried on every write
+        self.retry_seq = 0
+        self.snapshotting = False
+        self.closed = False
+
+    def _path(self, prefix, seq):
+        return os.path.join(self.directory, f"{prefix}{seq:020d}{SUFFIX}")
+
+    def _files(self, prefix):
+        files = []
+        for name in os.listdir(self.directory):
+            seq = _file_seq(name, prefix)
+            if seq is not None:
+                files.append((seq, os.path.join(self.directory, name)))
+        return sorted(files)
+
+    def open(self, store):
+        """Replay the snapshot and log tail into store, then start logging
+        every write made to it"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.store = store
+        self._recover()
+        self.segment = open(self._path(SEGMENT_PREFIX, self.seq + 1), "a", encoding="utf-8")
+        self.synced_seq = self.seq
+        store.journal = self
+        threading.Thread(target=self._flush_loop, name="task-log-flusher", daemon=True).start()
+        return self
+
+    def _recover(self):
+        snapshots = self._files(SNAPSHOT_PREFIX)
+        if snapshots:
+            self.snapshot_seq, path = snapshots[-1]
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    self.store.apply({"op": "add", "task": json.loads(line)})
+        self.seq = self.snapshot_seq
+
+        for _, path in self._files(SEGMENT_PREFIX):
+            with open(path, "r+b") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn write from a crash, cut it off so new
+                        # records aren't appended after it
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    if record["seq"] > self.seq:
+                        self.store.apply(record)
+                        self.seq = record["seq"]
+
+    def append(self, record):
+        """Append a record and return its sequence number. Called with the
+        store lock held so the log order matches the order writes applied."""
+        with self.lock:
+            self.seq += 1
+            record["seq"] = self.seq
+            self.segment.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.synced.notify_all()
+            seq = self.seq
+            start_snapshot = (
+                seq - self.snapshot_seq >= self.snapshot_every
+                and seq >= self.retry_seq
+                and not self.snapshotting
+            )
+            if start_snapshot:
+                self.snapshotting = True
+        if start_snapshot:
+            threading.Thread(target=self._background_snapshot, name="task-log-snapshot", daemon=True).start()
+        return seq
+
+    def wait(self, seq):
+        """Block until the record with this sequence number is on disk"""
+        with self.lock:
+            while self.synced_seq < seq and not self.closed:
+                self.synced.wait()
+
+    def _flush_loop(self):
+        while True:
+            with self.lock:
+                while self.synced_seq == self.seq and not self.closed:
+                    self.synced.wait()
+                if self.closed:
+                    return
+                segment, seq = self.segment, self.seq
+                segment.flush()
+            # fsync outside the lock so writers can keep appending meanwhile
+            with self.io_lock:
+                if not segment.closed:
+                    os.fsync(segment.fileno())
+            with self.lock:
+                self.synced_seq = max(self.synced_seq, seq)
+                self.synced.notify_all()
+
+    def _background_snapshot(self):
+        try:
+            self.snapshot()
+        except Exception as e:
+            # The log keeps every record, so nothing is lost; replay just
+            # gets longer until a snapshot succeeds
+            print(f"Task log snapshot failed, retrying after {self.snapshot_every} more records: {e}")
+
+    def snapshot(self):
+        """Write a snapshot of the store and drop the log it replaces"""
+        try:
+            with self.store.lock:
+                with self.lock:
+                    seq = self.seq
+                    self._rotate()
+                # Tasks are replaced, never mutated, so this list stays
+                # consistent after the lock is released
+                tasks = list(self.store.tasks.values())
+
+            path = self._path(SNAPSHOT_PREFIX, seq)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                for task in tasks:
+                    f.write(json.dumps(task, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            self._fsync_directory()
+            self.snapshot_seq = seq
+
+            for old_seq, old_path in self._files(SNAPSHOT_PREFIX):
+                if old_seq < seq:
+                    os.remove(old_path)
+            for start_seq, old_path in self._files(SEGMENT_PREFIX):
+                if start_seq <= seq:
+                    os.remove(old_path)
+        except Exception:
+            with self.lock:
+                self.retry_seq = self.seq + self.snapshot_every
+            raise
+        finally:
+            self.snapshotting = False
+
+    def _rotate(self):
+        # Open the new segment first, so if that fails appends carry on in
+        # the old one
+        new = open(self._path(SEGMENT_PREFIX, self.seq + 1), "a", encoding="utf-8")
+        old = self.segment
+        try:
+            with self.io_lock:
+                old.flush()
+                os.fsync(old.fileno())
+                old.close()
+        except Exception:
+            new.close()
+            raise
+        self.synced_seq = self.seq
+        self.synced.notify_all()
+        self.segment = new
+
+    def _fsync_directory(self):
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        """Flush everything still buffered and stop the flusher thread"""
+        with self.lock:
+            if self.closed or self.segment is None:
+                return
+            with self.io_lock:
+                self.segment.flush()
+                os.fsync(self.segment.fileno())
+                self.segment.close()
+            self.synced_seq = self.seq
+            self.closed = True
+            self.synced.notify_all()
@@ -1,91 +1,358 @@
-from flask import Flask, jsonify, request
-from datetime import datetime, timedelta
+from flask import Flask, Response, jsonify, make_response, request
+from datetime import datetime
+from functools import wraps
+import atexit
+import json
+import os
+import uuid
+from sqlite_store import SqliteTaskStore
+from task_log import TaskLog
+from task_store import DATE_FIELDS, TIMESTAMP_FIELDS, TaskStore, task_to_json
 
 app = Flask(__name__)
 
-tasks = []
+# Storage backend: "memory" keeps tasks in an indexed in-memory store,
+# "sqlite" keeps them in a SQLite database at TASK_DB_PATH
+TASK_STORAGE = os.environ.get("TASK_STORAGE", "memory")
+TASK_DB_PATH = os.environ.get("TASK_DB_PATH", "/app/data/task_stats.db")
+# Directory for the in-memory store's write-ahead log and snapshots. Set
+# TASK_LOG_DIR to an empty string to keep tasks in memory only.
+TASK_LOG_DIR = os.environ.get("TASK_LOG_DIR", "/app/data/task_stats")
+TASK_SNAPSHOT_EVERY = int(os.environ.get("TASK_SNAPSHOT_EVERY", "100000"))
+# Number of tasks read from the store per chunk of /export_tasks
+EXPORT_PAGE_SIZE = 1000
+# Longest a /changes long poll may wait, in seconds
+MAX_CHANGES_TIMEOUT = 30
 
+if TASK_STORAGE == "sqlite":
+    os.makedirs(os.path.dirname(TASK_DB_PATH) or ".", exist_ok=True)
+    store = SqliteTaskStore(TASK_DB_PATH)
+elif TASK_STORAGE == "memory":
+    store = TaskStore()
+    if TASK_LOG_DIR:
+        task_log = TaskLog(TASK_LOG_DIR, snapshot_every=TASK_SNAPSHOT_EVERY).open(store)
+        atexit.register(task_log.close)
+else:
+    raise ValueError(f"Unknown TASK_STORAGE: {TASK_STORAGE}")
+
+# ETags are "<instance>-<store version>". The instance id changes on every
+# start so an ETag from before a restart never matches.
+INSTANCE_ID = uuid.uuid4().hex[:8]
+
+
+def conditional(view):
+    """Tag a read endpoint's response with the store version and answer
+    If-None-Match with 304 Not Modified while the store hasn't changed"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Read the version before building the body so the ETag is never
+        # newer than the data it describes
+        etag = f"{INSTANCE_ID}-{store.version}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+        response.set_etag(etag)
+        return response
+    return wrapper
+
+
+# Read endpoints take an optional user_id query parameter that limits them
+# to that user's tasks (tasks whose user_id field matches), answered from
+# the user's own partition of the store.
 
 @app.route("/stats", methods=["GET"])
+@conditional
 def get_stats():
-    total_tasks = len(tasks)
-    completed_tasks = sum(task.get("completed", False) for task in tasks)
-    pending_tasks = total_tasks - completed_tasks
-
-    # Calculate average completion time
-    completion_times = []
-    for task in tasks:
-        if task.get("completed", False) and task.get("stopped_at"):
-            created_at = datetime.strptime(task["created_at"], "%Y-%m-%d %H:%M:%S")
-            stopped_at = datetime.strptime(task["stopped_at"], "%Y-%m-%d %H:%M:%S")
-            completion_times.append((stopped_at - created_at).total_seconds())
-
-    avg_completion_time = sum(completion_times) / len(completion_times) if completion_times else 0
+    stats = store.stats(user=request.args.get("user_id"))
+
+    # Average completion time from the running totals kept by the store
+    completion_count = stats["completion_time_count"]
+    avg_completion_time = stats["completion_time_total"] / completion_count if completion_count else 0
     # Formatting the output to display min and sec instead of seconds
     avg_completion_time = f"{int(avg_completion_time // 60)} min {int(avg_completion_time % 60)} sec"
 
     return jsonify({
-        "total_tasks": total_tasks,
-        "completed_tasks": completed_tasks,
-        "pending_tasks": pending_tasks,
+        "total_tasks": stats["total_tasks"],
+        "completed_tasks": stats["completed_tasks"],
+        "pending_tasks": stats["pending_tasks"],
         "avg_completion_time": avg_completion_time
     })
 
 @app.route("/task_summary", methods=["GET"])
+@conditional
 def task_summary():
     summary = {
         "low": {"completed": 0, "not_completed": 0},
         "medium": {"completed": 0, "not_completed": 0},
         "high": {"completed": 0, "not_completed": 0}
     }
-    for task in tasks:
-        priority = task.get("priority", "low")
-        if task.get("completed", False):
-            summary[priority]["completed"] += 1
-        else:
-            summary[priority]["not_completed"] += 1
+    summary.update(store.summary(user=request.args.get("user_id")))
 
     return jsonify(summary)
 
 @app.route("/completion_times", methods=["GET"])
+@conditional
 def completion_times():
     # Return a list of completion times (in seconds) for completed tasks
-    completion_times = []
-    for task in tasks:
-        if task.get("completed", False) and task.get("stopped_at"):
-            created_at = datetime.strptime(task["created_at"], "%Y-%m-%d %H:%M:%S")
-            stopped_at = datetime.strptime(task["stopped_at"], "%Y-%m-%d %H:%M:%S")
-            completion_time = (stopped_at - created_at).total_seconds()
-            completion_times.append({"completion_time": completion_time})
+    completion_times = [
+        {"completion_time": seconds}
+        for seconds in store.completion_times(user=request.args.get("user_id"))
+    ]
 
     return jsonify(completion_times)
 
+def id_error(task_id):
+    """Why a task id can't be used, or None if it can. Ids are dict keys
+    in the store, so lists and objects can't be ids."""
+    if task_id is None:
+        return "Task id is required!"
+    if isinstance(task_id, bool) or not isinstance(task_id, (str, int, float)):
+        return "Task id must be a string or a number!"
+    return None
+
+def task_error(task):
+    """Why a task or change can't be stored, or None if it can. Dates and
+    timestamps have to be sent as strings; the store keeps its own parsed
+    form of them as numbers."""
+    if not isinstance(task, dict):
+        return "Task id is required!"
+    error = id_error(task.get("id"))
+    if error is not None:
+        return error
+    for field in TIMESTAMP_FIELDS + DATE_FIELDS:
+        value = task.get(field)
+        if value is not None and not isinstance(value, str):
+            return f"{field} must be a string!"
+    return None
+
 @app.route("/add_task", methods=["POST"])
 def add_task():
     task = request.json
-    tasks.append(task)
+    error = task_error(task)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    store.add(task)
     return jsonify({"message": "Task added successfully!"})
 
 @app.route("/view_tasks", methods=["GET"])
+@conditional
 def view_tasks():
-    return jsonify({"tasks": tasks})
+    # Optional keyset pagination (limit, after) and field projection (fields)
+    limit = request.args.get("limit")
+    after = request.args.get("after")
+    try:
+        limit = int(limit) if limit else None
+        after = int(after) if after else None
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    fields = request.args.get("fields")
+    fields = [field for field in fields.split(",") if field] if fields else None
+
+    tasks, next_cursor = store.page(after=after, limit=limit, user=request.args.get("user_id"))
+    return jsonify({
+        "tasks": [task_to_json(task, fields) for task in tasks],
+        "next_cursor": str(next_cursor) if next_cursor is not None else None
+    })
+
+@app.route("/query_tasks", methods=["GET"])
+@conditional
+def query_tasks():
+    # Tasks matching every given criterion, looked up in the store's indexes.
+    # priority may list several comma separated values.
+    priority = request.args.get("priority")
+    criteria = {"priority": priority.split(",") if priority else None}
+    completed = request.args.get("completed")
+    if completed is not None:
+        criteria["completed"] = completed.lower() == "true"
+    due_date = request.args.get("due_date")
+    if due_date:
+        try:
+            criteria["due_date"] = datetime.strptime(due_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            return jsonify({"error": "Invalid date format"}), 400
+    # Only the tasks named by repeated id parameters, e.g. the matches of a
+    # full-text search, looked up by id. Ids arrive as strings, so a number
+    # also matches a task stored with an int id.
+    ids = request.args.getlist("id")
+    if ids:
+        criteria["ids"] = ids + [int(task_id) for task_id in ids if task_id.isdigit() and str(int(task_id)) == task_id]
+    fields = request.args.get("fields")
+    fields = [field for field in fields.split(",") if field] if fields else None
+
+    tasks = store.find(user=request.args.get("user_id"), **criteria)
+    return jsonify({"tasks": [task_to_json(task, fields) for task in tasks]})
+
+@app.route("/export_tasks", methods=["GET"])
+@conditional
+def export_tasks():
+    # Stream every task as newline-delimited JSON. Tasks are read from the
+    # store a page at a time, so memory use doesn't grow with the task count.
+    fields = request.args.get("fields")
+    fields = [field for field in fields.split(",") if field] if fields else None
+    user = request.args.get("user_id")
+
+    def generate():
+        after = None
+        while True:
+            tasks, after = store.page(after=after, limit=EXPORT_PAGE_SIZE, user=user)
+            if tasks:
+                yield "".join(json.dumps(task_to_json(task, fields)) + "\n" for task in tasks)
+            if after is None:
+                return
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+@app.route("/version", methods=["GET"])
+def get_version():
+    # Cheap way for other services to find out whether anything changed
+    return jsonify({"version": store.version, "instance": INSTANCE_ID})
+
+@app.route("/changes", methods=["GET"])
+def get_changes():
+    # Changes after the given version. With timeout, waits up to that many
+    # seconds for a change (long poll). "reset" means the changes since that
+    # version are no longer kept and the caller has to reload every task.
+    try:
+        since = int(request.args.get("since", 0))
+        timeout = min(float(request.args.get("timeout", 0)), MAX_CHANGES_TIMEOUT)
+    except ValueError:
+        return jsonify({"error": "Invalid since or timeout"}), 400
+    if timeout > 0 and since == store.version:
+        store.changes.wait(since, timeout)
+
+    events = store.changes.since(since)
+    if events is None:
+        return jsonify({"version": store.version, "instance": INSTANCE_ID, "reset": True, "changes": []})
+    changes = []
+    for version, op, task_id, task in events:
+        change = {"version": version, "op": op, "id": task_id}
+        if task is not None:
+            change["task"] = task_to_json(task)
+        changes.append(change)
+    version = changes[-1]["version"] if changes else since
+    return jsonify({"version": version, "instance": INSTANCE_ID, "reset": False, "changes": changes})
 
 @app.route("/update_task", methods=["POST"])
 def update_task():
     task_data = request.json
+    error = task_error(task_data)
+    if error is not None:
+        return jsonify({"error": error}), 400
     task_id = task_data.get("id")
-    for task in tasks:
-        if task["id"] == task_id:
-            task.update(task_data)
-            return jsonify({"message": "Task updated successfully!"})
+    if store.update(task_id, task_data) is not None:
+        return jsonify({"message": "Task updated successfully!"})
     return jsonify({"error": "Task not found!"}), 404
 
 @app.route("/delete_task", methods=["POST"])
 def delete_task():
-    task_id = request.json.get("id")
-    global tasks
-    tasks = [task for task in tasks if task["id"] != task_id]
+    task_id = (request.json or {}).get("id")
+    error = id_error(task_id)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    store.delete(task_id)
     return jsonify({"message": "Task deleted successfully!"})
 
+# Batch variants of add/update/delete. Each takes a list, applies every item
+# in one pass over the store and returns a result per item, in order.
+
+def _batch_items(key):
+    items = (request.json or {}).get(key)
+    if not isinstance(items, list):
+        return None
+    return items
+
+def _error_result(item, error):
+    task_id = item.get("id") if isinstance(item, dict) else None
+    if id_error(task_id) is not None:
+        task_id = None
+    return {"id": task_id, "status": "error", "error": error}
+
+@app.route("/add_tasks", methods=["POST"])
+def add_tasks():
+    tasks = _batch_items("tasks")
+    if tasks is None:
+        return jsonify({"error": "Expected a list of tasks!"}), 400
+    errors = [task_error(task) for task in tasks]
+    store.add_many([task for task, error in zip(tasks, errors) if error is None])
+    results = [
+        {"id": task["id"], "status": "added"} if error is None else _error_result(task, error)
+        for task, error in zip(tasks, errors)
+    ]
+    return jsonify({"results": results})
+
+@app.route("/update_tasks", methods=["POST"])
+def update_tasks():
+    tasks = _batch_items("tasks")
+    if tasks is None:
+        return jsonify({"error": "Expected a list of tasks!"}), 400
+    errors = [task_error(task) for task in tasks]
+    updated = iter(store.update_many([task for task, error in zip(tasks, errors) if error is None]))
+    results = []
+    for task, error in zip(tasks, errors):
+        if error is not None:
+            results.append(_error_result(task, error))
+        elif next(updated) is None:
+            results.append({"id": task["id"], "status": "not_found"})
+        else:
+            results.append({"id": task["id"], "status": "updated"})
+    return jsonify({"results": results})
+
+@app.route("/delete_tasks", methods=["POST"])
+def delete_tasks():
+    task_ids = _batch_items("ids")
+    if task_ids is None:
+        return jsonify({"error": "Expected a list of ids!"}), 400
+    errors = [id_error(task_id) for task_id in task_ids]
+    deleted = iter(store.delete_many([task_id for task_id, error in zip(task_ids, errors) if error is None]))
+    results = []
+    for task_id, error in zip(task_ids, errors):
+        if error is not None:
+            results.append({"id": None, "status": "error", "error": error})
+        else:
+            results.append({"id": task_id, "status": "deleted" if next(deleted) is not None else "not_found"})
+    return jsonify({"results": results})
+
+# Complete or reopen tasks in place. The change only applies while the task's
+# completed flag is still "expected" (by default the opposite of the new
+# value), so concurrent completes can't overwrite each other.
+
+def _completion_result(item, status, task):
+    result = {"id": item["id"], "status": status}
+    if task is not None:
+        result["task"] = task_to_json(task)
+    return result
+
+@app.route("/complete_task", methods=["POST"])
+def complete_task():
+    item = request.json or {}
+    error = task_error(item)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    status, task = store.set_completed_many([item])[0]
+    if status == "not_found":
+        return jsonify({"error": "Task not found!"}), 404
+    if status == "conflict":
+        state = "completed" if task.get("completed") else "not completed"
+        return jsonify({"error": f"Task is already {state}!", "task": task_to_json(task)}), 409
+    return jsonify({"message": "Task updated successfully!", "task": task_to_json(task)})
+
+@app.route("/complete_tasks", methods=["POST"])
+def complete_tasks():
+    items = _batch_items("tasks")
+    if items is None:
+        return jsonify({"error": "Expected a list of tasks!"}), 400
+    errors = [task_error(item) for item in items]
+    outcomes = iter(store.set_completed_many([item for item, error in zip(items, errors) if error is None]))
+    results = []
+    for item, error in zip(items, errors):
+        if error is not None:
+            results.append(_error_result(item, error))
+        else:
+            results.append(_completion_result(item, *next(outcomes)))
+    return jsonify({"results": results})
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
@@ -0,0 +1,597 @@
+import threading
+from bisect import bisect_right, insort
+from collections import deque
+from itertools import islice
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+EPOCH = datetime(1970, 1, 1)
+
+# Timestamps are stored as seconds since EPOCH and dates as ordinals. The
+# wire format stays as the strings the frontend sends; values that can't be
+# parsed are kept as they were sent. Only strings are parsed, and task_stats
+# rejects any other type for these fields, so an int stored in one of them
+# is always a parsed value.
+TIMESTAMP_FIELDS = ("created_at", "stopped_at")
+DATE_FIELDS = ("due_date",)
+
+# Fields that get a secondary index, with the default used when a task omits them
+INDEXED_FIELDS = {
+    "priority": "low",
+    "completed": False,
+    "due_date": None,
+}
+
+
+def index_key(task, field):
+    """Return the value a task is indexed under for the given field"""
+    value = task.get(field, INDEXED_FIELDS[field])
+    if field == "completed":
+        return bool(value)
+    return value
+
+
+def parse_timestamp(value):
+    """Convert a timestamp string to epoch seconds"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return int((datetime.strptime(value, TIMESTAMP_FORMAT) - EPOCH).total_seconds())
+    except ValueError:
+        return value
+
+
+def parse_date(value):
+    """Convert a YYYY-MM-DD string to a date ordinal"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return datetime.strptime(value, DATE_FORMAT).toordinal()
+    except ValueError:
+        return value
+
+
+@lru_cache(maxsize=65536)
+def format_timestamp(value):
+    return (EPOCH + timedelta(seconds=value)).strftime(TIMESTAMP_FORMAT)
+
+
+@lru_cache(maxsize=4096)
+def format_date(value):
+    return date.fromordinal(value).strftime(DATE_FORMAT)
+
+
+def format_value(formatter, value):
+    """Format a stored timestamp or date, or return it unchanged if it is
+    out of range (e.g. a number stored by an older version)"""
+    try:
+        return formatter(value)
+    except (ValueError, OverflowError, OSError):
+        return value
+
+
+def normalize_task(task):
+    """Copy of a task with its timestamps and dates in native form"""
+    record = dict(task)
+    for field in TIMESTAMP_FIELDS:
+        if field in record:
+            record[field] = parse_timestamp(record[field])
+    for field in DATE_FIELDS:
+        if field in record:
+            record[field] = parse_date(record[field])
+    if record.get("user_id") is not None:
+        record["user_id"] = str(record["user_id"])
+    return record
+
+
+def task_owner(task):
+    """The user a task belongs to as a string, matching the user_id query
+    parameter, or None"""
+    user = task.get("user_id")
+    return str(user) if user is not None else None
+
+
+def task_to_json(task, fields=None):
+    """Copy of a stored task with timestamps and dates formatted as strings,
+    limited to the given fields if any"""
+    if fields is None:
+        data = dict(task)
+    else:
+        data = {field: task[field] for field in fields if field in task}
+    for field in TIMESTAMP_FIELDS:
+        value = data.get(field)
+        if type(value) is int:
+            data[field] = format_value(format_timestamp, value)
+    for field in DATE_FIELDS:
+        value = data.get(field)
+        if type(value) is int:
+            data[field] = format_value(format_date, value)
+    return data
+
+
+def completion_seconds(task):
+    """Seconds between creation and completion, or None if not completed"""
+    if not task.get("completed", False):
+        return None
+    created_at = task.get("created_at")
+    stopped_at = task.get("stopped_at")
+    if type(created_at) is not int or type(stopped_at) is not int:
+        return None
+    return float(stopped_at - created_at)
+
+
+def completion_changes(item):
+    """Normalized changes that complete or reopen a task. Reopening clears
+    stopped_at, completing keeps the given stopped_at or uses now."""
+    completed = bool(item.get("completed", True))
+    stopped_at = None
+    if completed:
+        stopped_at = item.get("stopped_at") or datetime.now().strftime(TIMESTAMP_FORMAT)
+    return normalize_task({"id": item["id"], "completed": completed, "stopped_at": stopped_at})
+
+
+def _criterion(field, value):
+    """Convert a query value to the form a field is indexed under"""
+    if field == "completed":
+        return bool(value)
+    if field == "due_date":
+        return parse_date(value)
+    return value
+
+
+class ChangeLog:
+    """Bounded in-memory log of recent task changes, used by /changes.
+
+    Every change gets the next version number. Only the last size changes
+    are kept; a consumer that falls further behind has to resync.
+    """
+
+    def __init__(self, size=10000):
+        self.events = deque(maxlen=size)
+        self.version = 0
+        self.updated = threading.Condition()
+
+    def record(self, op, task_id, task=None):
+        with self.updated:
+            self.version += 1
+            self.events.append((self.version, op, task_id, task))
+            self.updated.notify_all()
+
+    def since(self, version):
+        """Changes after version as (version, op, id, task) tuples, or None
+        if some of them are no longer kept"""
+        with self.updated:
+            if version > self.version:
+                return None
+            if version == self.version:
+                return []
+            oldest = self.events[0][0] if self.events else self.version + 1
+            if version < oldest - 1:
+                return None
+            # Versions in the log are consecutive
+            return list(islice(self.events, version - oldest + 1, None))
+
+    def wait(self, version, timeout):
+        """Block until there is a change after version or timeout passes"""
+        with self.updated:
+            self.updated.wait_for(lambda: self.version != version, timeout)
+
+
+class TaskPartition:
+    """Secondary indexes, running aggregates and insertion order of one
+    set of tasks: either every task or the tasks of one user.
+
+    order holds the positions of the partition's tasks in insertion order.
+    Positions of tasks that left the partition stay in it until it is
+    compacted, and a task that leaves and comes back can appear twice, so
+    readers skip positions whose task isn't in ids and repeated positions.
+    """
+
+    def __init__(self):
+        self.ids = set()
+        self.order = []
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        # Running aggregates
+        self.completed_count = 0
+        self.priority_counts = {}
+        self.completion_by_id = {}
+        self.completion_total = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, task, position=None):
+        """Index a task. position is given when the task is new to the
+        partition, to add it to the partition's order."""
+        self.ids.add(task["id"])
+        if position is not None:
+            if not self.order or position > self.order[-1]:
+                self.order.append(position)
+            else:
+                insort(self.order, position)
+        for field, index in self.indexes.items():
+            index.setdefault(index_key(task, field), set()).add(task["id"])
+        self._count(task, 1)
+
+    def remove(self, task):
+        self.ids.discard(task["id"])
+        for field, index in self.indexes.items():
+            key = index_key(task, field)
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.discard(task["id"])
+                if not bucket:
+                    del index[key]
+        self._count(task, -1)
+
+    def compact(self, position_ids):
+        if len(self.order) > 2 * len(self.ids) + 1024:
+            self.order = sorted({position for position in self.order if position_ids.get(position) in self.ids})
+
+    def _count(self, task, delta):
+        completed = index_key(task, "completed")
+        priority = index_key(task, "priority")
+        counts = self.priority_counts.setdefault(priority, {"completed": 0, "not_completed": 0})
+        counts["completed" if completed else "not_completed"] += delta
+        if completed:
+            self.completed_count += delta
+        if delta > 0:
+            seconds = completion_seconds(task)
+            if seconds is not None:
+                self.completion_by_id[task["id"]] = seconds
+                self.completion_total += seconds
+        else:
+            seconds = self.completion_by_id.pop(task["id"], None)
+            if seconds is not None:
+                # Reset when empty so float error can't accumulate forever
+                self.completion_total = self.completion_total - seconds if self.completion_by_id else 0.0
+
+    def stats(self):
+        total = len(self.ids)
+        return {
+            "total_tasks": total,
+            "completed_tasks": self.completed_count,
+            "pending_tasks": total - self.completed_count,
+            "completion_time_total": self.completion_total,
+            "completion_time_count": len(self.completion_by_id),
+        }
+
+    def summary(self):
+        return {
+            priority: dict(counts) for priority, counts in self.priority_counts.items()
+            if counts["completed"] or counts["not_completed"]
+        }
+
+    def matching_ids(self, criteria):
+        """Ids of the tasks matching every criterion, or None if there are
+        no criteria"""
+        buckets = []
+        for field, value in criteria.items():
+            if value is None:
+                continue
+            index = self.indexes[field]
+            if isinstance(value, (list, tuple, set)):
+                # Any of several values, e.g. priority in (high, medium)
+                values = {_criterion(field, item) for item in value}
+                bucket = set()
+                for item in values:
+                    bucket |= index.get(item, set())
+                buckets.append(bucket)
+            else:
+                buckets.append(index.get(_criterion(field, value), set()))
+        if not buckets:
+            return None
+        if len(buckets) == 1:
+            return buckets[0]
+        buckets.sort(key=len)
+        smallest, rest = buckets[0], buckets[1:]
+        return {task_id for task_id in smallest if all(task_id in bucket for bucket in rest)}
+
+
+class TaskStore:
+    """In-memory task store keyed by id, partitioned by user.
+
+    Tasks are kept in insertion order so /view_tasks keeps returning them
+    in the order they were added. A task's user_id field names its owner.
+    Every task is indexed in the partition of all tasks and, if it has an
+    owner, in that user's partition, each with its own secondary indexes
+    on priority, completed and due_date and running aggregates for /stats
+    and /task_summary. Reads take an optional user and only touch that
+    user's partition, so they cost O(the user's tasks) however many users
+    there are.
+
+    Tasks are normalized on the way in (see normalize_task) and returned
+    in stored form; use task_to_json to format them for a response.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tasks = {}
+        self.positions = {}
+        self.next_position = 0
+        # The task at each position, for cursor pagination
+        self.position_ids = {}
+        self.everyone = TaskPartition()
+        self.partitions = {}
+        # Optional TaskLog that records every write, see task_log.py
+        self.journal = None
+        # Recent changes, also the store version used for ETags
+        self.changes = ChangeLog()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    @property
+    def version(self):
+        return self.changes.version
+
+    def _partition(self, user):
+        """Partition for a user, all tasks when user is None"""
+        if user is None:
+            return self.everyone
+        return self.partitions.get(str(user)) or TaskPartition()
+
+    def _user_partition(self, user):
+        partition = self.partitions.get(user)
+        if partition is None:
+            partition = self.partitions[user] = TaskPartition()
+        return partition
+
+    def _index(self, task, position):
+        self.everyone.add(task, position)
+        user = task_owner(task)
+        if user is not None:
+            self._user_partition(user).add(task, position)
+
+    def _unindex(self, task):
+        self.everyone.remove(task)
+        user = task_owner(task)
+        if user is not None:
+            partition = self.partitions[user]
+            partition.remove(task)
+            if not partition:
+                del self.partitions[user]
+
+    def stats(self, user=None):
+        """Task counts and completion time totals for /stats"""
+        with self.lock:
+            return self._partition(user).stats()
+
+    def completion_times(self, user=None):
+        """Completion seconds of completed tasks, in task order"""
+        with self.lock:
+            completion_by_id = self._partition(user).completion_by_id
+            ids = sorted(completion_by_id, key=self.positions.__getitem__)
+            return [completion_by_id[task_id] for task_id in ids]
+
+    def summary(self, user=None):
+        """Completed/not completed counts per priority for /task_summary"""
+        with self.lock:
+            return self._partition(user).summary()
+
+    def add(self, task):
+        """Insert a task, replacing any existing task with the same id"""
+        task = normalize_task(task)
+        with self.lock:
+            self._insert(task)
+            seq = self._journal({"op": "add", "task": task})
+        self._commit(seq)
+        return task
+
+    def _insert(self, task):
+        existing = self.tasks.pop(task["id"], None)
+        if existing is not None:
+            del self.position_ids[self.positions[task["id"]]]
+            self._unindex(existing)
+        self.tasks[task["id"]] = task
+        self.positions[task["id"]] = self.next_position
+        self.position_ids[self.next_position] = task["id"]
+        self._index(task, self.next_position)
+        self.next_position += 1
+        self._compact_order(task)
+        self.changes.record("add", task["id"], task)
+
+    def get(self, task_id):
+        return self.tasks.get(task_id)
+
+    def update(self, task_id, changes):
+        """Apply changes to a task, returns None if it doesn't exist"""
+        changes = normalize_task(changes)
+        changes["id"] = task_id
+        with self.lock:
+            task = self._update(task_id, changes)
+            if task is None:
+                return None
+            seq = self._journal({"op": "update", "id": task_id, "changes": changes})
+        self._commit(seq)
+        return task
+
+    def _update(self, task_id, changes):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        # Stored tasks are replaced rather than mutated so a snapshot can
+        # keep reading the old record without holding the lock
+        old_user = task_owner(task)
+        old, task = task, dict(task)
+        task.update(changes)
+        self.tasks[task_id] = task
+        self.everyone.remove(old)
+        self.everyone.add(task)
+        user = task_owner(task)
+        if old_user is not None:
+            self.partitions[old_user].remove(old)
+        if user is not None:
+            # A task that changes owner joins the new user's order
+            self._user_partition(user).add(task, None if user == old_user else self.positions[task_id])
+        if old_user is not None and not self.partitions[old_user]:
+            del self.partitions[old_user]
+        self.changes.record("update", task_id, task)
+        return task
+
+    def delete(self, task_id):
+        """Remove a task, returns the removed task or None"""
+        with self.lock:
+            task = self._remove(task_id)
+            if task is None:
+                return None
+            seq = self._journal({"op": "delete", "id": task_id})
+        self._commit(seq)
+        return task
+
+    def add_many(self, tasks):
+        """Insert several tasks under one lock and one journal commit"""
+        tasks = [normalize_task(task) for task in tasks]
+        seq = None
+        with self.lock:
+            for task in tasks:
+                self._insert(task)
+                seq = self._journal({"op": "add", "task": task})
+        self._commit(seq)
+        return tasks
+
+    def update_many(self, updates):
+        """Apply a list of changes, each holding the id of the task to
+        change. Returns the updated tasks, with None for missing ids."""
+        results = []
+        seq = None
+        with self.lock:
+            for changes in updates:
+                changes = normalize_task(changes)
+                task = self._update(changes["id"], changes)
+                if task is not None:
+                    seq = self._journal({"op": "update", "id": changes["id"], "changes": changes})
+                results.append(task)
+        self._commit(seq)
+        return results
+
+    def delete_many(self, task_ids):
+        """Remove several tasks, returns the removed tasks with None for
+        missing ids"""
+        results = []
+        seq = None
+        with self.lock:
+            for task_id in task_ids:
+                task = self._remove(task_id)
+                if task is not None:
+                    seq = self._journal({"op": "delete", "id": task_id})
+                results.append(task)
+        self._commit(seq)
+        return results
+
+    def set_completed_many(self, items):
+        """Complete or reopen several tasks with compare-and-set.
+
+        Each item holds the task id, completed (default True), optionally
+        stopped_at and optionally expected, the completed value the task
+        must still have; it defaults to the opposite of completed, so a
+        task is only completed or reopened once. Returns a (status, task)
+        pair per item with status "updated", "not_found" or "conflict";
+        task is the stored task after the call.
+        """
+        results = []
+        seq = None
+        with self.lock:
+            for item in items:
+                changes = completion_changes(item)
+                task = self.tasks.get(changes["id"])
+                if task is None:
+                    results.append(("not_found", None))
+                elif bool(task.get("completed")) != item.get("expected", not changes["completed"]):
+                    results.append(("conflict", task))
+                else:
+                    task = self._update(changes["id"], changes)
+                    seq = self._journal({"op": "update", "id": changes["id"], "changes": changes})
+                    results.append(("updated", task))
+        self._commit(seq)
+        return results
+
+    def _remove(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if task is not None:
+            del self.position_ids[self.positions.pop(task_id)]
+            self._unindex(task)
+            self._compact_order(task)
+            self.changes.record("delete", task_id)
+        return task
+
+    def _compact_order(self, task):
+        self.everyone.compact(self.position_ids)
+        partition = self.partitions.get(task_owner(task))
+        if partition is not None:
+            partition.compact(self.position_ids)
+
+    def _journal(self, record):
+        if self.journal is None:
+            return None
+        return self.journal.append(record)
+
+    def _commit(self, seq):
+        # Wait for the journal to make the write durable outside the lock
+        # so concurrent writers can share one fsync
+        if seq is not None:
+            self.journal.wait(seq)
+
+    def apply(self, record):
+        """Replay a journal record without journaling it again"""
+        with self.lock:
+            if record["op"] == "add":
+                self._insert(record["task"])
+            elif record["op"] == "update":
+                self._update(record["id"], record["changes"])
+            elif record["op"] == "delete":
+                self._remove(record["id"])
+
+    def all(self):
+        with self.lock:
+            return list(self.tasks.values())
+
+    def page(self, after=None, limit=None, user=None):
+        """Return up to limit tasks added after the cursor position, and the
+        cursor for the next page (None when there are no more tasks)"""
+        with self.lock:
+            if after is None and limit is None and user is None:
+                return list(self.tasks.values()), None
+            partition = self._partition(user)
+            order = partition.order
+            start = 0 if after is None else bisect_right(order, after)
+            tasks = []
+            last = None
+            for i in range(start, len(order)):
+                position = order[i]
+                task_id = self.position_ids.get(position)
+                if position == last or task_id not in partition.ids:
+                    continue
+                if limit is not None and len(tasks) == limit:
+                    return tasks, last
+                tasks.append(self.tasks[task_id])
+                last = position
+            return tasks, None
+
+    def count(self, user=None, **criteria):
+        """Count tasks matching the given index criteria"""
+        with self.lock:
+            partition = self._partition(user)
+            ids = partition.matching_ids(criteria)
+            return len(partition) if ids is None else len(ids)
+
+    def find(self, user=None, ids=None, **criteria):
+        """Return tasks whose indexed fields match every given criterion,
+        in insertion order. A criterion can be a list to match any of its
+        values. Criteria with a value of None are ignored. ids, if given,
+        limits the result to those tasks, which are looked up by id rather
+        than found by scanning the partition."""
+        with self.lock:
+            if ids is None and user is None and not any(value is not None for value in criteria.values()):
+                return list(self.tasks.values())
+            partition = self._partition(user)
+            matching = partition.matching_ids(criteria)
+            if ids is not None:
+                matching = {
+                    task_id for task_id in ids
+                    if task_id in partition.ids and (matching is None or task_id in matching)
+                }
+            ids = sorted(partition.ids if matching is None else matching, key=self.positions.__getitem__)
+            return [self.tasks[task_id] for task_id in ids]
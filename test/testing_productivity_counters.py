@@ -0,0 +1,180 @@
+"""
+Productivity Counters Test Suite
+
+This test suite checks the counters behind the Productivity Analysis
+service (productivity_analysis.py) without starting any service:
+
+1. Owner moves: a task handed from one user to another, to no user and
+   back moves its counts between the users' counters, and the totals for
+   everyone don't change.
+2. Random changes: a reproducible mix of adds, edits, owner changes,
+   completions and deletes is fed to UserCounters the way TaskReplica
+   reports them. The counters for everyone and for every user must then
+   match counters built from scratch out of the tasks that are left, down
+   to the per priority and per day buckets.
+
+Usage:
+    python testing_productivity_counters.py --operations 5000 --seed 1
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import date
+from colorama import init, Fore, Style
+
+# Add parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from productivity_analysis import ProductivityCounters, UserCounters
+
+# Initialize colorama for Windows compatibility
+init()
+
+# 7 is an int on purpose: it must be counted as user "7"
+USERS = ["alice", "bob", 7, None]
+PRIORITIES = ["low", "medium", "high", None]
+DAYS = ["2024-03-18", "2024-03-19", "2024-03-20"]
+
+
+def print_test_result(passed: bool, test_name: str):
+    """Helper function to print test results"""
+    if passed:
+        print(f"{Fore.GREEN}[PASS] {test_name}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}[FAIL] {test_name}{Style.RESET_ALL}")
+
+
+def make_task(rng, task_id):
+    completed = rng.random() < 0.5
+    return {
+        "id": task_id,
+        "priority": rng.choice(PRIORITIES),
+        "completed": completed,
+        "created_at": f"{rng.choice(DAYS)} 09:00:00",
+        "stopped_at": f"{rng.choice(DAYS)} 17:00:00" if completed else None,
+        "user_id": rng.choice(USERS),
+    }
+
+
+def counts(counters):
+    """Everything the counters hold, for comparison"""
+    return {
+        "total": counters.total,
+        "completed": counters.completed,
+        "priorities": counters.priorities,
+        "created_days": counters.created_days,
+        "completed_days": counters.completed_days,
+    }
+
+
+def built_from(tasks):
+    counters = ProductivityCounters()
+    for task in tasks:
+        counters.update(None, task)
+    return counts(counters)
+
+
+def test_owner_moves():
+    """
+    Tests that a task's counts follow it from owner to owner.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Tasks Moving Between Owners ==={Style.RESET_ALL}")
+    counters = UserCounters()
+    task = {"id": "task1", "priority": "high", "completed": True,
+            "created_at": "2024-03-20 09:00:00", "stopped_at": "2024-03-20 17:00:00", "user_id": "alice"}
+    other = dict(task, id="task2", completed=False, stopped_at=None)
+    counters.update(None, task)
+    counters.update(None, other)
+
+    all_passed = True
+    for owner in ["bob", None, 7, "alice"]:
+        moved = dict(task, user_id=owner)
+        counters.update(task, moved)
+        task = moved
+        expected = {str(owner)} if owner is not None else set()
+        holders = {user for user, scoped in counters.users.items() if scoped.completed}
+        passed = holders == expected and counters.everyone.percentage() == 50
+        print(f"Moved to {owner!r}: completed task counted for {sorted(holders)}, "
+              f"everyone at {counters.everyone.percentage()}% (Expected: {sorted(expected)}, 50.0%)")
+        print_test_result(passed, f"Task Moved To {owner!r}")
+        all_passed = all_passed and passed
+
+    alice = counters.user("alice").detailed(date(2024, 3, 20))
+    passed = alice["productivity_percentage"] == 50 and alice["by_priority"]["high"]["total_tasks"] == 2
+    print(f"alice: {alice['productivity_percentage']}% of {alice['by_priority']['high']['total_tasks']} "
+          f"high priority tasks (Expected: 50.0% of 2)")
+    print_test_result(passed, "Moved Back Counts Once")
+
+    counters.update(task, None)
+    counters.update(other, None)
+    empty = counts(counters.user("alice")) == counts(ProductivityCounters())
+    print(f"alice empty after deleting both tasks: {empty}")
+    print_test_result(empty, "Deleted Tasks Uncounted")
+    return all_passed and passed and empty
+
+
+def test_random_changes(operation_count, seed):
+    """
+    Tests that counters kept current change by change match counters built
+    from the final tasks, for everyone and for every user.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Random Changes ==={Style.RESET_ALL}")
+    rng = random.Random(seed)
+    counters = UserCounters()
+    tasks = {}
+    ids = [f"task{i}" for i in range(operation_count // 10 + 1)]
+    for _ in range(operation_count):
+        task_id = rng.choice(ids)
+        old = tasks.get(task_id)
+        roll = rng.random()
+        if old is None or roll < 0.2:
+            new = make_task(rng, task_id)
+        elif roll < 0.5:
+            new = dict(old, user_id=rng.choice(USERS))
+        elif roll < 0.7:
+            new = dict(old, priority=rng.choice(PRIORITIES))
+        elif roll < 0.85:
+            completed = not old["completed"]
+            new = dict(old, completed=completed, stopped_at=f"{rng.choice(DAYS)} 12:00:00" if completed else None)
+        else:
+            new = None
+        counters.update(old, new)
+        if new is None:
+            tasks.pop(task_id, None)
+        else:
+            tasks[task_id] = new
+
+    print(f"Ran {operation_count} changes, {len(tasks)} tasks left")
+    passed = counts(counters.everyone) == built_from(tasks.values())
+    print_test_result(passed, "Counters For Everyone")
+    for user in USERS[:-1] + ["nobody"]:
+        owned = [task for task in tasks.values() if task["user_id"] is not None and str(task["user_id"]) == str(user)]
+        matches = counts(counters.user(user)) == built_from(owned)
+        print(f"User {user!r}: {len(owned)} tasks, counters match: {matches}")
+        print_test_result(matches, f"Counters For User {user!r}")
+        passed = passed and matches
+    return passed
+
+
+def run_all_tests(operation_count, seed):
+    print(f"{Fore.CYAN}Starting Productivity Counter Tests{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}==================================={Style.RESET_ALL}")
+    moves_passed = test_owner_moves()
+    random_passed = test_random_changes(operation_count, seed)
+
+    all_passed = moves_passed and random_passed
+    print(f"\n{Fore.CYAN}=== Final Test Results ==={Style.RESET_ALL}")
+    print_test_result(moves_passed, "Owner Move Tests")
+    print_test_result(random_passed, "Random Change Tests")
+    print_test_result(all_passed, "Overall Test Suite")
+    return all_passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check productivity counters against recounts")
+    parser.add_argument("--operations", type=int, default=5000, help="random task changes to apply")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the random changes")
+    args = parser.parse_args()
+    sys.exit(0 if run_all_tests(args.operations, args.seed) else 1)
@@ -0,0 +1,251 @@
+"""
+Reminder Scheduler Test Suite
+
+This test suite checks the ReminderScheduler (reminder_scheduler.py) behind
+the Reminder service's /reminder_events stream without starting any service:
+
+1. Reload: a task due tomorrow fires due_soon once when added. Completing
+   it, reopening it and reloading it the way TaskReplica does (every task
+   deleted, then re-added) must give exactly one more due_soon, for the
+   reopen.
+2. Thresholds: with thresholds moved a fraction of a second ahead, the timer
+   thread fires due_soon and then overdue on its own.
+3. Generations: a task rescheduled or deleted before its thresholds come up
+   fires only for its current schedule.
+4. Compaction: rescheduling the same tasks over and over keeps the heap
+   bounded instead of growing with every change.
+5. History: a subscriber reconnecting with Last-Event-ID gets the events it
+   missed, and only those.
+
+Usage:
+    python testing_reminder_scheduler.py
+"""
+
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timedelta
+from colorama import init, Fore, Style
+
+# Add parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reminder_scheduler import ReminderScheduler
+
+# Initialize colorama for Windows compatibility
+init()
+
+# Seconds to wait for the timer thread to fire
+FIRE_TIMEOUT = 5
+
+
+def print_test_result(passed: bool, test_name: str):
+    """Helper function to print test results"""
+    if passed:
+        print(f"{Fore.GREEN}[PASS] {test_name}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}[FAIL] {test_name}{Style.RESET_ALL}")
+
+
+def make_task(task_id, due_date, completed=False):
+    return {
+        "id": task_id,
+        "title": f"Task {task_id}",
+        "due_date": due_date,
+        "completed": completed,
+        "user_id": "alice",
+    }
+
+
+def day(offset):
+    return (datetime.now() + timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+def drain(subscriber, timeout=0):
+    """(kind, task_id) of every event in a subscriber's queue, waiting up
+    to timeout seconds for the first one"""
+    events = []
+    while True:
+        try:
+            event = subscriber.get(timeout=timeout) if timeout and not events else subscriber.get_nowait()
+        except queue.Empty:
+            return events
+        events.append((event["kind"], event["task"]["id"]))
+
+
+def wait_for(subscriber, count):
+    """The first count events of a subscriber, or fewer on timeout"""
+    events = []
+    deadline = time.time() + FIRE_TIMEOUT
+    while len(events) < count and time.time() < deadline:
+        events.extend(drain(subscriber, deadline - time.time()))
+    return events
+
+
+def check(actual, expected, test_name):
+    passed = actual == expected
+    print(f"Got: {actual} (Expected: {expected})")
+    print_test_result(passed, test_name)
+    return passed
+
+
+def soon_scheduler(delays):
+    """A scheduler whose thresholds are delays seconds from now instead of
+    days, keyed by task id, so the timer thread fires within the test"""
+    scheduler = ReminderScheduler()
+
+    def thresholds(task):
+        if task is None or task.get("completed") or task["id"] not in delays:
+            return None
+        due_soon, overdue = delays[task["id"]]
+        return (time.time() + due_soon, time.time() + overdue)
+
+    scheduler._thresholds = thresholds
+    return scheduler
+
+
+def test_reload():
+    """
+    Tests that a task due tomorrow is reminded about once, again after it
+    is reopened, and not again when the replica reloads.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Complete, Reopen And Reload ==={Style.RESET_ALL}")
+    scheduler = ReminderScheduler(horizon_days=1)
+    subscriber = scheduler.subscribe()
+    task = make_task("task1", day(1))
+
+    scheduler.update(None, task)
+    passed = check(drain(subscriber), [("due_soon", "task1")], "Due Soon On Add")
+
+    completed = dict(task, completed=True)
+    scheduler.update(task, completed)
+    passed = check(drain(subscriber), [], "Nothing On Complete") and passed
+    passed = check(scheduler.scheduled(), 0, "Completed Task Unscheduled") and passed
+
+    scheduler.update(completed, task)
+    passed = check(drain(subscriber), [("due_soon", "task1")], "Due Soon Again On Reopen") and passed
+
+    # TaskReplica.reload reports every task as removed, then added again
+    scheduler.update(task, None)
+    scheduler.update(None, task)
+    passed = check(drain(subscriber), [], "Nothing On Reload") and passed
+    passed = check(scheduler.scheduled(), 1, "Reloaded Task Scheduled") and passed
+
+    moved = dict(task, due_date=day(0))
+    scheduler.update(task, moved)
+    passed = check(drain(subscriber), [("due_soon", "task1")], "Due Soon For A New Due Date") and passed
+    return passed
+
+
+def test_thresholds():
+    """
+    Tests that the timer thread fires due_soon and overdue as their times
+    come up, and that a task past both is no longer tracked as notified.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Threshold Firing ==={Style.RESET_ALL}")
+    scheduler = soon_scheduler({"task1": (0.2, 0.4)})
+    subscriber = scheduler.subscribe()
+    scheduler.start()
+    task = make_task("task1", day(1))
+    scheduler.update(None, task)
+
+    passed = check(wait_for(subscriber, 2), [("due_soon", "task1"), ("overdue", "task1")],
+                   "Due Soon Then Overdue")
+    passed = check(scheduler.notified, set(), "Overdue Clears Notified") and passed
+    return passed
+
+
+def test_generations():
+    """
+    Tests that heap entries left behind by a change are skipped: a task
+    moved later fires only at its new time, a deleted task never fires.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Generation Invalidation ==={Style.RESET_ALL}")
+    delays = {"moved": (0.2, 60), "deleted": (0.2, 60), "kept": (0.6, 60)}
+    scheduler = soon_scheduler(delays)
+    subscriber = scheduler.subscribe()
+    scheduler.start()
+    tasks = {task_id: make_task(task_id, day(1)) for task_id in delays}
+    for task in tasks.values():
+        scheduler.update(None, task)
+
+    delays["moved"] = (0.4, 60)
+    scheduler.update(tasks["moved"], tasks["moved"])
+    scheduler.update(tasks["deleted"], None)
+
+    events = wait_for(subscriber, 2)
+    # Give a stale entry the chance to fire late
+    events.extend(drain(subscriber, 0.3))
+    passed = check(events, [("due_soon", "moved"), ("due_soon", "kept")], "Only Current Entries Fire")
+    passed = check(scheduler.scheduled(), 2, "Deleted Task Unscheduled") and passed
+    return passed
+
+
+def test_compaction():
+    """
+    Tests that stale heap entries are dropped once they outnumber the live
+    ones, rather than piling up with every change to a task.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Heap Compaction ==={Style.RESET_ALL}")
+    scheduler = ReminderScheduler(horizon_days=1)
+    tasks = [make_task(f"task{i}", day(30)) for i in range(10)]
+    largest = 0
+    for _ in range(500):
+        for task in tasks:
+            scheduler.update(task, task)
+        largest = max(largest, len(scheduler.heap))
+    bound = 2 * len(tasks) + 1024 + 2
+    passed = largest <= bound
+    print(f"5000 changes to 10 tasks, largest heap: {largest} (Expected at most {bound})")
+    print_test_result(passed, "Heap Stays Bounded")
+
+    live = sum(1 for entry in scheduler.heap if scheduler._current(entry))
+    print(f"Current entries left in the heap: {live} (Expected: {2 * len(tasks)})")
+    print_test_result(live == 2 * len(tasks), "Current Entries Kept")
+    return passed and live == 2 * len(tasks)
+
+
+def test_history():
+    """
+    Tests that a subscriber reconnecting with Last-Event-ID is sent the
+    events after that id, followed by new ones.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Last-Event-ID History ==={Style.RESET_ALL}")
+    scheduler = ReminderScheduler(horizon_days=1)
+    first = scheduler.subscribe()
+    for i in range(3):
+        scheduler.update(None, make_task(f"task{i}", day(0)))
+    seen = first.get_nowait()
+    scheduler.unsubscribe(first)
+
+    second = scheduler.subscribe(last_event_id=seen["id"])
+    scheduler.update(None, make_task("task3", day(1)))
+    expected = [("due_soon", "task1"), ("due_soon", "task2"), ("due_soon", "task3")]
+    passed = check(drain(second), expected, "Missed Events Replayed")
+    late = [event for event in drain(first) if event[1] == "task3"]
+    passed = check(late, [], "Unsubscribed Queue Left Alone") and passed
+    return passed
+
+
+def run_all_tests():
+    print(f"{Fore.CYAN}Starting Reminder Scheduler Tests{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}================================={Style.RESET_ALL}")
+    results = {
+        "Reload Tests": test_reload(),
+        "Threshold Tests": test_thresholds(),
+        "Generation Tests": test_generations(),
+        "Compaction Tests": test_compaction(),
+        "History Tests": test_history(),
+    }
+
+    all_passed = all(results.values())
+    print(f"\n{Fore.CYAN}=== Final Test Results ==={Style.RESET_ALL}")
+    for name, passed in results.items():
+        print_test_result(passed, name)
+    print_test_result(all_passed, "Overall Test Suite")
+    return all_passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
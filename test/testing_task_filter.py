@@ -3,8 +3,10 @@ Task Filter Service Test Suite
 
 This test suite validates the Task Filter microservice which handles:
 1. Filtering tasks by various criteria (priority, completion status, due date)
-2. Saving and managing filter preferences
-3. Retrieving and clearing saved preferences
+2. Due date ranges, sorting, limits and full-text search
+3. Caching of repeated filter queries
+4. Saving and managing named filter preferences per user
+5. Retrieving and clearing saved preferences
 
 Microservice Endpoints Tested:
 -----------------------------
@@ -13,16 +15,21 @@ Task Filter Service (http://localhost:5003):
         - priority: 'low', 'medium', 'high'
         - completed: 'true', 'false'
         - due_date: 'YYYY-MM-DD'
+        - due_from, due_to: 'YYYY-MM-DD' range bounds
+        - sort: 'due_date', 'priority', 'created_at'; limit: max results
+        - search: words to find in titles and descriptions
+    
+    - GET /filter_cache_stats: Hit and miss counters of the result cache
     
     - POST /save_filter_preferences: Saves user's filter preferences
         - Accepts JSON body with filter criteria
-        - Stores in filter_preferences.json
+        - Optional user and name, default "default" for both
     
     - GET /get_saved_preferences: Retrieves saved filter preferences
-        - Returns current saved preferences from filter_preferences.json
+        - Returns a user's saved preferences, or only the named one
     
-    - POST /clear_preferences: Clears all saved filter preferences
-        - Resets filter_preferences.json to empty state
+    - POST /clear_preferences: Clears saved filter preferences
+        - Removes the named preference, or all of the user's preferences
 
 Task Stats Service (http://localhost:5001):
     - POST /add_task: Creates new tasks (used for test data)
@@ -83,6 +90,7 @@ def setup_test_data():
     - 1 completed high priority task
     - 1 pending high priority task
     - 1 pending low priority task
+    - 1 pending medium priority task without a due date
     
     Uses Task Stats service endpoint:
     - POST /add_task
@@ -115,6 +123,16 @@ def setup_test_data():
             "completed": False,
             "due_date": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
             "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        },
+        {
+            # The dashboard sends an empty due date for tasks without one
+            "id": "test4",
+            "title": "Medium Priority No Due Date",
+            "description": "Test task 4",
+            "priority": "medium",
+            "completed": False,
+            "due_date": "",
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
     ]
     
@@ -151,6 +169,22 @@ def test_filter_tasks():
     3. Due Date Filter:
        - Endpoint: GET /filter_tasks?due_date=YYYY-MM-DD
        - Expected: Returns tasks due on specific date
+       
+    4. Due Date Range:
+       - Endpoint: GET /filter_tasks?due_to=YYYY-MM-DD
+       - Expected: Returns tasks due by that date, not tasks without one
+       
+    5. Sort And Limit:
+       - Endpoint: GET /filter_tasks?completed=false&sort=due_date&limit=2
+       - Expected: Returns the next 2 pending tasks due, soonest first
+       
+    6. Search:
+       - Endpoint: GET /filter_tasks?search=low
+       - Expected: Returns the task with "Low" in its title
+       
+    7. Result Cache:
+       - Endpoint: GET /filter_cache_stats
+       - Expected: Repeating a query counts as a cache hit
     """
     print(f"\n{Fore.CYAN}=== Testing Filter Tasks Endpoint ==={Style.RESET_ALL}")
     all_tests_passed = True
@@ -201,6 +235,55 @@ def test_filter_tasks():
         print_test_result(test_passed, "Due Date Filter Test")
         all_tests_passed = all_tests_passed and test_passed
     
+    # Test 4: Filter by due date range
+    print(f"\n{Fore.YELLOW}Test 4: Filter by due date range (due by {today}){Style.RESET_ALL}")
+    response = requests.get(f"{BASE_URL}/filter_tasks", params={"due_to": today})
+    test_passed = response.ok
+    if response.ok:
+        ids = sorted(task["id"] for task in response.json().get("filtered_tasks", []))
+        test_passed = ids == ["test1", "test2"]
+        print(f"Found tasks {ids} (Expected: ['test1', 'test2'], no task without a due date)")
+    print_test_result(test_passed, "Due Date Range Test")
+    all_tests_passed = all_tests_passed and test_passed
+    
+    # Test 5: Sort by due date and limit
+    print(f"\n{Fore.YELLOW}Test 5: Next 2 pending tasks due{Style.RESET_ALL}")
+    response = requests.get(f"{BASE_URL}/filter_tasks",
+                            params={"completed": "false", "sort": "due_date", "limit": 2})
+    test_passed = response.ok
+    if response.ok:
+        ids = [task["id"] for task in response.json().get("filtered_tasks", [])]
+        test_passed = ids == ["test2", "test3"]
+        print(f"Found tasks {ids} (Expected: ['test2', 'test3'])")
+    print_test_result(test_passed, "Sort And Limit Test")
+    all_tests_passed = all_tests_passed and test_passed
+    
+    # Test 6: Full-text search
+    print(f"\n{Fore.YELLOW}Test 6: Search titles and descriptions{Style.RESET_ALL}")
+    response = requests.get(f"{BASE_URL}/filter_tasks", params={"search": "low"})
+    test_passed = response.ok
+    if response.ok:
+        ids = [task["id"] for task in response.json().get("filtered_tasks", [])]
+        test_passed = ids == ["test3"]
+        print(f"Found tasks {ids} (Expected: ['test3'])")
+    print_test_result(test_passed, "Search Test")
+    all_tests_passed = all_tests_passed and test_passed
+    
+    # Test 7: A repeated query is answered from the result cache
+    print(f"\n{Fore.YELLOW}Test 7: Result cache{Style.RESET_ALL}")
+    before = requests.get(f"{BASE_URL}/filter_cache_stats")
+    first = requests.get(f"{BASE_URL}/filter_tasks", params={"priority": "high,low"})
+    second = requests.get(f"{BASE_URL}/filter_tasks", params={"priority": "low,high"})
+    after = requests.get(f"{BASE_URL}/filter_cache_stats")
+    test_passed = before.ok and first.ok and second.ok and after.ok
+    if test_passed:
+        hits = after.json()["hits"] - before.json()["hits"]
+        same_result = first.json() == second.json()
+        test_passed = hits >= 1 and same_result
+        print(f"Cache hits during the test: {hits}, same result: {same_result}")
+    print_test_result(test_passed, "Result Cache Test")
+    all_tests_passed = all_tests_passed and test_passed
+    
     return all_tests_passed
 
 def test_preferences():
@@ -211,7 +294,7 @@ def test_preferences():
     1. Save Preferences:
        - Endpoint: POST /save_filter_preferences
        - Payload: JSON with filter criteria
-       - Expected: Successfully saves preferences to file
+       - Expected: Successfully saves the default user's preference
        
     2. Get Preferences:
        - Endpoint: GET /get_saved_preferences
@@ -220,6 +303,11 @@ def test_preferences():
     3. Clear Preferences:
        - Endpoint: POST /clear_preferences
        - Expected: Removes all saved preferences
+       
+    4. Named Preferences:
+       - Endpoints: all three, with user and name
+       - Expected: Each user's named preferences are kept apart and can
+         be read and cleared one at a time
     """
     print(f"\n{Fore.CYAN}=== Testing Preferences Endpoints ==={Style.RESET_ALL}")
     all_tests_passed = True
@@ -258,6 +346,31 @@ def test_preferences():
             print_test_result(is_empty, "Clear Preferences Test")
             all_tests_passed = all_tests_passed and is_empty
     
+    # Test 4: Named preferences of another user
+    print(f"\n{Fore.YELLOW}Test 4: Named preferences per user{Style.RESET_ALL}")
+    user = "filter_test_user"
+    for name, priority in (("urgent", "high"), ("later", "low")):
+        requests.post(f"{BASE_URL}/save_filter_preferences",
+                      json={"user": user, "name": name, "priority": priority})
+    named = requests.get(f"{BASE_URL}/get_saved_preferences", params={"user": user, "name": "urgent"})
+    default_user = requests.get(f"{BASE_URL}/get_saved_preferences")
+    requests.post(f"{BASE_URL}/clear_preferences", json={"user": user, "name": "urgent"})
+    remaining = requests.get(f"{BASE_URL}/get_saved_preferences", params={"user": user})
+    requests.post(f"{BASE_URL}/clear_preferences", json={"user": user})
+    test_passed = named.ok and default_user.ok and remaining.ok
+    if test_passed:
+        named_prefs = named.json().get("saved_preferences", [])
+        remaining_names = [pref.get("name") for pref in remaining.json().get("saved_preferences", [])]
+        test_passed = (
+            [pref.get("priority") for pref in named_prefs] == ["high"]
+            and default_user.json().get("saved_preferences") == []
+            and remaining_names == ["later"]
+        )
+        print(f"Named preference: {named_prefs}")
+        print(f"Left after clearing 'urgent': {remaining_names}")
+    print_test_result(test_passed, "Named Preferences Test")
+    all_tests_passed = all_tests_passed and test_passed
+    
     return all_tests_passed
 
 def cleanup_test_data():
@@ -297,21 +410,28 @@ def display_documentation():
     print("       ├── Parameters:")
     print("       │   ├── priority: 'low', 'medium', 'high'")
     print("       │   ├── completed: 'true', 'false'")
-    print("       │   └── due_date: 'YYYY-MM-DD'")
+    print("       │   ├── due_date: 'YYYY-MM-DD'")
+    print("       │   ├── due_from, due_to: 'YYYY-MM-DD'")
+    print("       │   ├── sort: 'due_date', 'priority', 'created_at'")
+    print("       │   ├── limit: maximum number of tasks")
+    print("       │   └── search: words in titles and descriptions")
     print("       └── Returns filtered list of tasks")
     
+    print("\n   └── GET /filter_cache_stats")
+    print("       └── Returns hit and miss counters of the result cache")
+    
     print("\n   └── POST /save_filter_preferences")
     print("       ├── Saves user's filter preferences")
-    print("       ├── Accepts JSON body with filter criteria")
-    print("       └── Stores in filter_preferences.json")
+    print("       ├── Accepts JSON body with filter criteria, user and name")
+    print("       └── Stores in the user's file under PREFERENCES_DIR")
     
     print("\n   └── GET /get_saved_preferences")
     print("       ├── Retrieves saved filter preferences")
-    print("       └── Returns current saved preferences")
+    print("       └── Returns a user's preferences, or only the named one")
     
     print("\n   └── POST /clear_preferences")
-    print("       ├── Clears all saved filter preferences")
-    print("       └── Resets filter_preferences.json to empty state")
+    print("       ├── Clears saved filter preferences")
+    print("       └── Removes the named preference, or all of the user's")
     
     # Task Stats Service Documentation
     print(f"\n{Fore.GREEN}2. Task Stats Service (http://localhost:5001){Style.RESET_ALL}")
@@ -330,6 +450,7 @@ def display_documentation():
     print("1. High Priority Complete task (due today)")
     print("2. High Priority Pending task (due today)")
     print("3. Low Priority Pending task (due tomorrow)")
+    print("4. Medium Priority Pending task (no due date)")
     
     print(f"\n{Fore.YELLOW}Test Flow:{Style.RESET_ALL}")
     print("1. Validates service accessibility")
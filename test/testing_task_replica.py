@@ -0,0 +1,218 @@
+"""
+Task Replica Test Suite
+
+This test suite checks the TaskReplica (task_client.py) that the Reminder,
+Task Filter and Productivity Analysis services keep of the tasks. The Task
+Stats service (task_stats.py) is served in-process on a free local port,
+with an in-memory store, so nothing has to be started first:
+
+1. First sync: the replica loads every task, projected to its fields.
+2. Changes: adds, updates, completions and deletes reach the replica and
+   its listener through /changes, one listener call per change.
+3. Reset: a replica that falls further behind than /changes keeps reloads
+   every task instead of missing changes.
+4. Instance: after task_stats restarts with different tasks at the same
+   version, the replica notices the new instance id and reloads.
+
+Throughout, a copy of the tasks built only from the listener calls
+(listener(old, new)) must match the replica, and each call's old task must
+be the one the listener was last given, which is what the counters and the
+reminder scheduler rely on.
+
+Usage:
+    python testing_task_replica.py
+"""
+
+import logging
+import os
+import sys
+import threading
+from colorama import init, Fore, Style
+from werkzeug.serving import make_server
+
+# Add parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# In-memory store without a log directory
+os.environ["TASK_STORAGE"] = "memory"
+os.environ["TASK_LOG_DIR"] = ""
+
+import task_stats
+from task_client import TaskReplica
+from task_store import ChangeLog, TaskStore
+
+# Initialize colorama for Windows compatibility
+init()
+
+FIELDS = ["priority", "completed", "user_id"]
+
+
+def print_test_result(passed: bool, test_name: str):
+    """Helper function to print test results"""
+    if passed:
+        print(f"{Fore.GREEN}[PASS] {test_name}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}[FAIL] {test_name}{Style.RESET_ALL}")
+
+
+def check(actual, expected, test_name):
+    passed = actual == expected
+    print(f"Got: {actual!r} (Expected: {expected!r})")
+    print_test_result(passed, test_name)
+    return passed
+
+
+class Mirror:
+    """Tasks rebuilt from listener calls alone, counting the calls and any
+    whose old task isn't the one last passed in"""
+
+    def __init__(self):
+        self.tasks = {}
+        self.calls = 0
+        self.mismatches = 0
+
+    def listener(self, old, new):
+        self.calls += 1
+        task_id = (new or old)["id"]
+        if old != self.tasks.get(task_id):
+            self.mismatches += 1
+        if new is None:
+            self.tasks.pop(task_id, None)
+        else:
+            self.tasks[task_id] = new
+
+
+def start_task_stats():
+    """Serve the Task Stats app on a free port, returns its base URL"""
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, task_stats.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def add_tasks(client, ids, **fields):
+    for task_id in ids:
+        task = dict({"id": task_id, "title": f"Task {task_id}", "priority": "low", "completed": False,
+                     "user_id": "alice"}, **fields)
+        client.post("/add_task", json=task)
+
+
+def expected_tasks():
+    """Every task in task_stats, projected the way the replica keeps them"""
+    return {
+        task["id"]: {field: task[field] for field in ["id", *FIELDS] if field in task}
+        for task in task_stats.store.all()
+    }
+
+
+def consistent(replica, mirror, test_name):
+    """Replica, listener copy and task_stats all hold the same tasks"""
+    expected = expected_tasks()
+    passed = replica.tasks == expected and mirror.tasks == expected and mirror.mismatches == 0
+    print(f"task_stats: {len(expected)} tasks, replica: {len(replica.tasks)}, "
+          f"listener copy: {len(mirror.tasks)}, calls with a wrong old task: {mirror.mismatches}")
+    print_test_result(passed, test_name)
+    return passed
+
+
+def test_first_sync(replica, mirror, client):
+    """
+    Tests that the first sync loads every task through the listener.
+    """
+    print(f"\n{Fore.CYAN}=== Testing First Sync ==={Style.RESET_ALL}")
+    add_tasks(client, ["task1", "task2", "task3"])
+    replica.sync()
+    passed = check(mirror.calls, 3, "One Listener Call Per Task")
+    passed = check(sorted(replica.tasks["task1"]), ["completed", "id", "priority", "user_id"],
+                   "Tasks Projected To Fields") and passed
+    return consistent(replica, mirror, "Replica Loaded") and passed
+
+
+def test_changes(replica, mirror, client):
+    """
+    Tests that each change after the first sync reaches the listener once,
+    with the task as it was before the change.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Incremental Changes ==={Style.RESET_ALL}")
+    instance = replica.instance
+    calls = mirror.calls
+    add_tasks(client, ["task4"], priority="high")
+    client.post("/update_task", json={"id": "task1", "priority": "medium", "user_id": "bob"})
+    client.post("/complete_task", json={"id": "task2"})
+    client.post("/delete_task", json={"id": "task3"})
+    replica.sync()
+    passed = check(mirror.calls - calls, 4, "One Listener Call Per Change")
+    passed = check(replica.tasks["task1"]["user_id"], "bob", "Update Applied") and passed
+    passed = check(replica.tasks["task2"]["completed"], True, "Completion Applied") and passed
+    passed = check("task3" in replica.tasks, False, "Delete Applied") and passed
+    passed = check(replica.instance, instance, "No Reload Needed") and passed
+
+    calls = mirror.calls
+    replica.sync()
+    passed = check(mirror.calls - calls, 0, "Nothing Repeated By Another Sync") and passed
+    return consistent(replica, mirror, "Replica Follows Changes") and passed
+
+
+def test_reset(replica, mirror, client):
+    """
+    Tests that a replica that fell behind the kept changes reloads.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Reset After Falling Behind ==={Style.RESET_ALL}")
+    log = ChangeLog(size=5)
+    log.version = task_stats.store.changes.version
+    task_stats.store.changes = log
+    add_tasks(client, [f"behind{i}" for i in range(10)])
+    client.post("/delete_task", json={"id": "task4"})
+
+    version = replica.version
+    replica.sync()
+    passed = check(replica.version > version + 5, True, "Caught Up Past The Gap")
+    return consistent(replica, mirror, "Replica Reloaded") and passed
+
+
+def test_instance(replica, mirror, client):
+    """
+    Tests that a task_stats restart is noticed by its new instance id, even
+    when the new store happens to be at the replica's version.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Task Stats Restart ==={Style.RESET_ALL}")
+    old_instance = replica.instance
+    restarted = TaskStore()
+    task_stats.store = restarted
+    task_stats.INSTANCE_ID = "restarted"
+    add_tasks(client, ["fresh1", "fresh2"], user_id="carol")
+    # Bring the new store to the replica's version with no changes to replay
+    restarted.changes.version = replica.version
+    restarted.changes.events.clear()
+
+    replica.sync()
+    passed = check(replica.instance != old_instance, True, "New Instance Picked Up")
+    passed = check(sorted(replica.tasks), ["fresh1", "fresh2"], "Tasks Of The Old Instance Dropped") and passed
+    return consistent(replica, mirror, "Replica Matches The Restarted Service") and passed
+
+
+def run_all_tests():
+    print(f"{Fore.CYAN}Starting Task Replica Tests{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}==========================={Style.RESET_ALL}")
+    client = task_stats.app.test_client()
+    replica = TaskReplica(fields=FIELDS, base_url=start_task_stats())
+    mirror = Mirror()
+    replica.add_listener(mirror.listener)
+
+    results = {
+        "First Sync Tests": test_first_sync(replica, mirror, client),
+        "Change Tests": test_changes(replica, mirror, client),
+        "Reset Tests": test_reset(replica, mirror, client),
+        "Instance Tests": test_instance(replica, mirror, client),
+    }
+
+    all_passed = all(results.values())
+    print(f"\n{Fore.CYAN}=== Final Test Results ==={Style.RESET_ALL}")
+    for name, passed in results.items():
+        print_test_result(passed, name)
+    print_test_result(all_passed, "Overall Test Suite")
+    return all_passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
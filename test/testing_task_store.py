@@ -0,0 +1,310 @@
+"""
+Task Store Test Suite
+
+This test suite checks the storage layer behind the Task Stats service
+without starting any service:
+
+1. Log replay: a TaskStore backed by a TaskLog (task_log.py) is written to,
+   snapshotted part way through and written to again. A fresh store that
+   replays the snapshot plus the log tail must match the live store.
+2. Torn tail: a log segment cut off in the middle of a record is truncated
+   on replay, and records written after the restart replay cleanly.
+3. Backends: the same operations are run against the in-memory TaskStore
+   (task_store.py) and SqliteTaskStore (sqlite_store.py), which must give
+   the same results. Both must also keep a page cursor valid when the
+   newest tasks are deleted and another is added.
+
+Each check compares tasks, pages, index lookups, /stats and /task_summary
+aggregates and completion times, for all tasks and for every user.
+
+Usage:
+    python testing_task_store.py --operations 3000 --seed 1
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+from colorama import init, Fore, Style
+
+# Add parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_store import SqliteTaskStore
+from task_log import TaskLog
+from task_store import TaskStore
+
+# Initialize colorama for Windows compatibility
+init()
+
+# 7 is an int on purpose: ?user_id=7 must still find that user's tasks
+USERS = ["alice", "bob", 7, None]
+QUERY_USERS = [None, "alice", "bob", "7", "nobody"]
+PRIORITIES = ["low", "medium", "high"]
+DUE_DATES = ["2024-03-20", "2024-03-21", "2024-03-22", "", "someday"]
+# Ids looked up directly, one of which never exists
+LOOKUP_IDS = ["task1", "task2", "task3", "task5", "task8", "missing"]
+
+
+def print_test_result(passed: bool, test_name: str):
+    """Helper function to print test results"""
+    if passed:
+        print(f"{Fore.GREEN}[PASS] {test_name}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}[FAIL] {test_name}{Style.RESET_ALL}")
+
+
+def make_task(rng, task_id):
+    completed = rng.random() < 0.5
+    return {
+        "id": task_id,
+        "title": f"Task {task_id}",
+        "description": "",
+        "priority": rng.choice(PRIORITIES),
+        "due_date": rng.choice(DUE_DATES),
+        "completed": completed,
+        "created_at": "2024-03-20 09:00:00",
+        "stopped_at": f"2024-03-20 {rng.randrange(10, 24)}:00:00" if completed else None,
+        "user_id": rng.choice(USERS),
+    }
+
+
+def random_operations(seed, count):
+    """A reproducible list of (method, args) store calls"""
+    rng = random.Random(seed)
+    ids = [f"task{i}" for i in range(count // 10 + 1)]
+    operations = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.35:
+            operations.append(("add", (make_task(rng, rng.choice(ids)),)))
+        elif roll < 0.45:
+            tasks = [make_task(rng, rng.choice(ids)) for _ in range(rng.randrange(1, 4))]
+            operations.append(("add_many", (tasks,)))
+        elif roll < 0.6:
+            changes = rng.choice([
+                {"user_id": rng.choice(USERS)},
+                {"priority": rng.choice(PRIORITIES)},
+                {"due_date": rng.choice(DUE_DATES)},
+                {"title": "Renamed"},
+            ])
+            operations.append(("update", (rng.choice(ids), changes)))
+        elif roll < 0.65:
+            updates = [{"id": rng.choice(ids), "priority": rng.choice(PRIORITIES)} for _ in range(2)]
+            operations.append(("update_many", (updates,)))
+        elif roll < 0.8:
+            items = [
+                {"id": rng.choice(ids), "completed": rng.random() < 0.5, "stopped_at": "2024-03-21 12:00:00"}
+                for _ in range(rng.randrange(1, 4))
+            ]
+            operations.append(("set_completed_many", (items,)))
+        elif roll < 0.92:
+            operations.append(("delete", (rng.choice(ids),)))
+        else:
+            operations.append(("delete_many", ([rng.choice(ids) for _ in range(2)],)))
+    return operations
+
+
+def run_operations(store, operations):
+    for method, args in operations:
+        getattr(store, method)(*args)
+
+
+def walk_pages(store, user, limit):
+    """Ids of every task a user can see, read a page at a time"""
+    ids, cursor = [], None
+    while True:
+        tasks, cursor = store.page(cursor, limit, user=user)
+        ids.extend(task["id"] for task in tasks)
+        if cursor is None:
+            return ids
+
+
+def describe(store):
+    """Everything a reader of the store can observe, for comparison"""
+    state = {"all": store.all()}
+    for user in QUERY_USERS:
+        state[user] = {
+            "find": store.find(user=user),
+            "pages": walk_pages(store, user, 7),
+            "stats": store.stats(user=user),
+            "summary": store.summary(user=user),
+            "completion_times": store.completion_times(user=user),
+            "high": store.count(user=user, priority="high"),
+            "completed": [task["id"] for task in store.find(user=user, completed=True)],
+            "due": [task["id"] for task in store.find(user=user, due_date="2024-03-21")],
+            "by_id": [task["id"] for task in store.find(user=user, ids=LOOKUP_IDS, completed=False)],
+        }
+    return state
+
+
+def report_differences(expected, actual):
+    """Print the parts of two store descriptions that differ"""
+    for key in expected:
+        if expected[key] == actual[key]:
+            continue
+        if key == "all":
+            print(f"  all tasks differ ({len(expected[key])} vs {len(actual[key])})")
+            continue
+        for check, value in expected[key].items():
+            if value != actual[key][check]:
+                print(f"  user {key!r}, {check}: {value!r} != {actual[key][check]!r}")
+
+
+def compare(expected, actual, test_name):
+    passed = expected == actual
+    if not passed:
+        report_differences(expected, actual)
+    print_test_result(passed, test_name)
+    return passed
+
+
+def test_log_replay(directory, operations):
+    """
+    Tests that a store recovered from its log matches the live store.
+
+    The first half of the operations ends up in a snapshot, the rest only
+    in the log tail, so replay has to combine both.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Log Replay ==={Style.RESET_ALL}")
+    half = len(operations) // 2
+    live = TaskStore()
+    log = TaskLog(directory, snapshot_every=len(operations) * 10).open(live)
+    run_operations(live, operations[:half])
+    log.snapshot()
+    run_operations(live, operations[half:])
+    log.close()
+
+    names = sorted(os.listdir(directory))
+    print(f"Log directory after the run: {names}")
+    has_snapshot = any(name.startswith("snapshot-") for name in names)
+    print_test_result(has_snapshot, "Snapshot Written")
+
+    replayed = TaskStore()
+    TaskLog(directory).open(replayed).close()
+    print(f"Live store: {len(live)} tasks, replayed store: {len(replayed)} tasks")
+    return compare(describe(live), describe(replayed), "Snapshot Plus Tail Replay") and has_snapshot
+
+
+def test_torn_tail(directory, rng):
+    """
+    Tests recovery from a record cut off by a crash.
+
+    Appends half a record to the newest log segment, replays, then writes
+    more tasks and replays again: the torn bytes must be dropped rather
+    than left in front of the new records.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Torn Log Tail ==={Style.RESET_ALL}")
+    live = TaskStore()
+    TaskLog(directory).open(live).close()
+    expected = describe(live)
+
+    segment = sorted(name for name in os.listdir(directory) if name.startswith("log-"))[-1]
+    with open(os.path.join(directory, segment), "a", encoding="utf-8") as f:
+        f.write('{"op":"add","task":{"id":"torn"')
+
+    recovered = TaskStore()
+    log = TaskLog(directory).open(recovered)
+    passed = compare(expected, describe(recovered), "Torn Record Dropped")
+
+    recovered.add(make_task(rng, "after-crash"))
+    log.close()
+    replayed = TaskStore()
+    TaskLog(directory).open(replayed).close()
+    found = replayed.get("after-crash") is not None and replayed.get("torn") is None
+    print(f"Task written after the restart replayed: {found}")
+    print_test_result(found, "Writes After Torn Tail Replay")
+    return compare(describe(recovered), describe(replayed), "Replay After Restart") and passed and found
+
+
+def test_backends(directory, operations):
+    """
+    Tests that TaskStore and SqliteTaskStore agree after the same operations.
+
+    Also checks the results of the batch completion calls, which the undo
+    and redo buttons rely on.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Memory And SQLite Backends ==={Style.RESET_ALL}")
+    memory = TaskStore()
+    sqlite = SqliteTaskStore(os.path.join(directory, "tasks.db"))
+    results_match = True
+    for i, (method, args) in enumerate(operations):
+        memory_result = getattr(memory, method)(*args)
+        sqlite_result = getattr(sqlite, method)(*args)
+        if method == "set_completed_many":
+            memory_statuses = [status for status, _ in memory_result]
+            sqlite_statuses = [status for status, _ in sqlite_result]
+            if memory_statuses != sqlite_statuses:
+                print(f"  operation {i}: {memory_statuses} != {sqlite_statuses}")
+                results_match = False
+    print(f"Ran {len(operations)} operations, {len(memory)} tasks left")
+    print_test_result(results_match, "Batch Completion Results")
+    return compare(describe(memory), describe(sqlite), "Backends Agree") and results_match
+
+
+def held_cursor_ids(store, reopen):
+    """Ids read from a cursor after the tasks up to and past it were deleted
+    and another task was added"""
+    rng = random.Random(0)
+    store.add_many([make_task(rng, f"cursor{i}") for i in range(3)])
+    _, cursor = store.page(limit=2)
+    store.delete_many(["cursor1", "cursor2"])
+    store = reopen(store)
+    store.add(make_task(rng, "cursor3"))
+    tasks, _ = store.page(after=cursor)
+    return [task["id"] for task in tasks]
+
+
+def test_held_cursor(directory):
+    """
+    Tests that a new task is never given the position of a deleted one.
+
+    A client paging through /view_tasks or /export_tasks holds the position
+    of the last task it read. If that task and the ones after it are deleted
+    and a new task takes over one of their positions, the client skips it.
+    The SQLite store is reopened in between, so its counter has to persist.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Cursors Across Deletes ==={Style.RESET_ALL}")
+    path = os.path.join(directory, "cursor.db")
+    all_passed = True
+    for name, store, reopen in (
+        ("TaskStore", TaskStore(), lambda store: store),
+        ("SqliteTaskStore", SqliteTaskStore(path), lambda store: SqliteTaskStore(path)),
+    ):
+        ids = held_cursor_ids(store, reopen)
+        passed = ids == ["cursor3"]
+        print(f"{name}: read {ids} after the cursor (Expected: ['cursor3'])")
+        print_test_result(passed, f"{name} Cursor Test")
+        all_passed = all_passed and passed
+    return all_passed
+
+
+def run_all_tests(operation_count, seed):
+    print(f"{Fore.CYAN}Starting Task Store Tests{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}========================={Style.RESET_ALL}")
+    operations = random_operations(seed, operation_count)
+    directory = tempfile.mkdtemp(prefix="task-store-test-")
+    try:
+        replay_passed = test_log_replay(os.path.join(directory, "log"), operations)
+        torn_passed = test_torn_tail(os.path.join(directory, "log"), random.Random(seed))
+        backends_passed = test_backends(directory, operations) and test_held_cursor(directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    all_passed = replay_passed and torn_passed and backends_passed
+    print(f"\n{Fore.CYAN}=== Final Test Results ==={Style.RESET_ALL}")
+    print_test_result(replay_passed, "Log Replay Tests")
+    print_test_result(torn_passed, "Torn Tail Tests")
+    print_test_result(backends_passed, "Backend Tests")
+    print_test_result(all_passed, "Overall Test Suite")
+    return all_passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check task store replay and backend consistency")
+    parser.add_argument("--operations", type=int, default=3000, help="random store operations to run")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the random operations")
+    args = parser.parse_args()
+    sys.exit(0 if run_all_tests(args.operations, args.seed) else 1)
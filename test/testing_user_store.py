@@ -0,0 +1,197 @@
+"""
+User Store Test Suite
+
+This test suite checks the UserStore (user_store.py) behind the User Data
+service without starting any service:
+
+1. Cache race: a read that overlaps a write must not leave the stale user
+   it read in the cache.
+2. Patch: given fields change, fields set to None are removed, the id can't
+   be changed, and both the cache and the email index see the new values.
+3. Import: /users/import (user_data.py, run through Flask's test client)
+   writes newline delimited users in chunks, stops at the first invalid
+   line with the count of users already written, and a re-imported user is
+   not served from a stale cached copy.
+4. Cache size: the cache never holds more than cache_size users, and a
+   reopened store reads the same users from the database.
+
+Usage:
+    python testing_user_store.py --users 2500
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from colorama import init, Fore, Style
+
+# Add parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_store import UserStore
+
+# Initialize colorama for Windows compatibility
+init()
+
+
+def print_test_result(passed: bool, test_name: str):
+    """Helper function to print test results"""
+    if passed:
+        print(f"{Fore.GREEN}[PASS] {test_name}{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}[FAIL] {test_name}{Style.RESET_ALL}")
+
+
+def make_user(user_id, **fields):
+    return dict({"id": user_id, "name": f"User {user_id}", "email": f"{user_id}@example.com"}, **fields)
+
+
+def check(actual, expected, test_name):
+    passed = actual == expected
+    print(f"Got: {actual!r} (Expected: {expected!r})")
+    print_test_result(passed, test_name)
+    return passed
+
+
+def test_cache_race(directory):
+    """
+    Tests that a read racing a write doesn't cache what it read.
+
+    The read's query is made to return the old row and a patch is committed
+    before the read gets to cache it, as a write landing between the two
+    would be.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Cache Against Racing Writes ==={Style.RESET_ALL}")
+    store = UserStore(os.path.join(directory, "race.db"))
+    store.create(make_user("u1", name="Old"))
+    query = store._query
+
+    def racing_query(sql, params=()):
+        rows = query(sql, params)
+        store._query = query
+        store.patch("u1", {"name": "New"})
+        return rows
+
+    store._query = racing_query
+    raced = store.get("u1")
+    passed = check(raced["name"], "Old", "Racing Read Returns What It Read")
+    passed = check("u1" in store.cache and store.cache["u1"]["name"], "New",
+                   "Write Wins The Cache") and passed
+    passed = check(store.get("u1")["name"], "New", "Next Read Sees The Write") and passed
+
+    store.cache.clear()
+    store.get("u1")
+    passed = check("u1" in store.cache, True, "Read Without A Race Is Cached") and passed
+    return passed
+
+
+def test_patch(directory):
+    """
+    Tests that a patch changes only the given fields and keeps the cache
+    and the email index in step.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Patch ==={Style.RESET_ALL}")
+    store = UserStore(os.path.join(directory, "patch.db"))
+    store.create(make_user("u1", city="Paris"))
+    store.get("u1")
+
+    patched = store.patch("u1", {"id": "u2", "email": "new@example.com", "city": None, "age": 30})
+    expected = {"id": "u1", "name": "User u1", "email": "new@example.com", "age": 30}
+    passed = check(patched, expected, "Patched User Returned")
+    passed = check(store.get("u1"), expected, "Cached Copy Refreshed") and passed
+    passed = check(UserStore(store.path).get("u1"), expected, "Patch Written To The Database") and passed
+    passed = check(store.get("u2"), None, "Id Not Changed") and passed
+    passed = check(store.find_by_email("u1@example.com"), [], "Old Email Unindexed") and passed
+    passed = check(store.find_by_email("new@example.com"), [expected], "New Email Indexed") and passed
+    passed = check(store.patch("missing", {"name": "Nobody"}), None, "Missing User Not Patched") and passed
+    passed = check(len(store), 1, "Nothing Created By Patch") and passed
+    return passed
+
+
+def import_lines(users):
+    return "".join(json.dumps(user) + "\n" for user in users)
+
+
+def test_import(directory, user_count):
+    """
+    Tests /users/import with several chunks, an invalid line part way
+    through, and a re-import of a user that is cached.
+    """
+    print(f"\n{Fore.CYAN}=== Testing /users/import ==={Style.RESET_ALL}")
+    os.environ["USER_DB_PATH"] = os.path.join(directory, "import.db")
+    import user_data
+    client = user_data.app.test_client()
+    chunk_size = user_data.IMPORT_CHUNK_SIZE
+
+    users = [make_user(f"u{i}") for i in range(user_count)]
+    response = client.post("/users/import", data=import_lines(users) + "\n")
+    passed = check((response.status_code, response.get_json()["created"]), (201, user_count),
+                   "Every User Imported")
+    passed = check(len(user_data.users), user_count, "Users In The Database") and passed
+    passed = check(client.get(f"/users/u{user_count - 1}").get_json(), users[-1], "Last User Readable") and passed
+
+    body = import_lines(make_user(f"v{i}") for i in range(chunk_size + 10))
+    lines = body.splitlines(keepends=True)
+    lines.insert(chunk_size + 5, "not json\n")
+    response = client.post("/users/import", data="".join(lines))
+    result = (response.status_code, response.get_json())
+    expected = (400, {"message": f"Invalid user on line {chunk_size + 6}!", "created": chunk_size})
+    passed = check(result, expected, "Import Stops At An Invalid Line") and passed
+    passed = check(len(user_data.users), user_count + chunk_size, "Full Chunks Before It Kept") and passed
+
+    client.get("/users/u0")
+    renamed = make_user("u0", name="Renamed")
+    client.post("/users/import", data=import_lines([renamed]))
+    passed = check(client.get("/users/u0").get_json(), renamed, "Re-imported User Not Stale") and passed
+    return passed
+
+
+def test_cache_size(directory):
+    """
+    Tests that the cache keeps only the most recently read users.
+    """
+    print(f"\n{Fore.CYAN}=== Testing Cache Size ==={Style.RESET_ALL}")
+    store = UserStore(os.path.join(directory, "lru.db"), cache_size=10)
+    store.create_many([make_user(f"u{i}") for i in range(50)])
+    passed = check(len(store.cache), 0, "Bulk Create Not Cached")
+    for i in range(50):
+        store.get(f"u{i}")
+        store.get("u0")
+    passed = check(len(store.cache), 10, "Cache Bounded") and passed
+    passed = check(list(store.cache)[-2:], ["u49", "u0"], "Most Recent Reads Kept") and passed
+
+    reopened = UserStore(store.path)
+    found = all(reopened.get(f"u{i}") == make_user(f"u{i}") for i in range(50))
+    passed = check(found, True, "Reopened Store Reads Every User") and passed
+    return passed
+
+
+def run_all_tests(user_count):
+    print(f"{Fore.CYAN}Starting User Store Tests{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}========================={Style.RESET_ALL}")
+    directory = tempfile.mkdtemp(prefix="user-store-test-")
+    try:
+        results = {
+            "Cache Race Tests": test_cache_race(directory),
+            "Patch Tests": test_patch(directory),
+            "Import Tests": test_import(directory, user_count),
+            "Cache Size Tests": test_cache_size(directory),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    all_passed = all(results.values())
+    print(f"\n{Fore.CYAN}=== Final Test Results ==={Style.RESET_ALL}")
+    for name, passed in results.items():
+        print_test_result(passed, name)
+    print_test_result(all_passed, "Overall Test Suite")
+    return all_passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the user store cache, patch and import")
+    parser.add_argument("--users", type=int, default=2500, help="users written by the import check")
+    args = parser.parse_args()
+    sys.exit(0 if run_all_tests(args.users) else 1)
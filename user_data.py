@@ -1,17 +1,68 @@
 from flask import Flask, request, jsonify
+import json
+import os
+from user_store import UserStore
 
 app = Flask(__name__)
 
+# Users live in a SQLite database with an in-process cache of recent reads
+USER_DB_PATH = os.environ.get("USER_DB_PATH", "/app/data/user_data.db")
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+# Users written per transaction by /users/import
+IMPORT_CHUNK_SIZE = 1000
 
-users = {}
+os.makedirs(os.path.dirname(USER_DB_PATH) or ".", exist_ok=True)
+users = UserStore(USER_DB_PATH, cache_size=USER_CACHE_SIZE)
 
 @app.route("/users", methods=["POST"])
 def create_user():
-    user_id = request.json.get("id")
     user_data = request.json
-    users[user_id] = user_data
+    if not isinstance(user_data, dict) or user_data.get("id") is None:
+        return jsonify({"message": "User id is required!"}), 400
+    users.create(user_data)
     return jsonify({"message": "User created successfully!"}), 201
 
+@app.route("/users", methods=["GET"])
+def find_users():
+    # Users with the given email, looked up in the email index
+    email = request.args.get("email")
+    if not email:
+        return jsonify({"message": "email is required!"}), 400
+    return jsonify({"users": users.find_by_email(email)})
+
+@app.route("/users/bulk", methods=["POST"])
+def create_users():
+    # Creates every user in the list in one transaction
+    user_list = (request.json or {}).get("users")
+    if not isinstance(user_list, list):
+        return jsonify({"message": "Expected a list of users!"}), 400
+    if any(not isinstance(user, dict) or user.get("id") is None for user in user_list):
+        return jsonify({"message": "Every user needs an id!"}), 400
+    created = users.create_many(user_list)
+    return jsonify({"message": "Users created successfully!", "created": created}), 201
+
+@app.route("/users/import", methods=["POST"])
+def import_users():
+    # Newline delimited JSON, one user per line, read from the request
+    # stream and written in chunks so large imports aren't held in memory
+    created, chunk = 0, []
+    for number, line in enumerate(request.stream, 1):
+        if not line.strip():
+            continue
+        try:
+            user = json.loads(line)
+        except ValueError:
+            user = None
+        if not isinstance(user, dict) or user.get("id") is None:
+            return jsonify({"message": f"Invalid user on line {number}!", "created": created}), 400
+        chunk.append(user)
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            created += users.create_many(chunk)
+            chunk = []
+    if chunk:
+        created += users.create_many(chunk)
+    return jsonify({"message": "Users imported successfully!", "created": created}), 201
+
 @app.route("/users/<user_id>", methods=["GET"])
 def get_user(user_id):
     user_data = users.get(user_id)
@@ -23,19 +74,29 @@ def get_user(user_id):
 @app.route("/users/<user_id>", methods=["PUT"])
 def update_user(user_id):
     user_data = request.json
-    if user_id in users:
-        users[user_id] = user_data
+    if users.replace(user_id, user_data):
         return jsonify({"message": "User updated successfully!"})
     else:
         return jsonify({"message": "User not found!"}), 404
 
+@app.route("/users/<user_id>", methods=["PATCH"])
+def patch_user(user_id):
+    # Only the given fields change; a field set to null is removed
+    changes = request.json
+    if not isinstance(changes, dict):
+        return jsonify({"message": "Expected an object of fields!"}), 400
+    user_data = users.patch(user_id, changes)
+    if user_data is not None:
+        return jsonify(user_data)
+    else:
+        return jsonify({"message": "User not found!"}), 404
+
 @app.route("/users/<user_id>", methods=["DELETE"])
 def delete_user(user_id):
-    if user_id in users:
-        del users[user_id]
+    if users.delete(user_id):
         return jsonify({"message": "User deleted successfully!"})
     else:
         return jsonify({"message": "User not found!"}), 404
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5006)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5006)
@@ -0,0 +1,155 @@
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlite_store import ConnectionPool
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+"""
+
+
+class UserStore:
+    """Users kept in a SQLite database, with an LRU cache of recent reads.
+
+    The full user is stored as JSON in the data column and email is copied
+    into its own indexed column for lookups. Nothing is loaded at startup:
+    lookups go through the primary key or the email index, and the most
+    recently read users are served from memory. Writes go to the database
+    first and then refresh or drop the cached copy. Connections come from a
+    ConnectionPool; the database runs in WAL mode so reads don't block the
+    writer.
+    """
+
+    def __init__(self, path, cache_size=10000):
+        self.path = path
+        self.pool = ConnectionPool(path, cached_statements=64)
+        self.lock = threading.RLock()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        # Bumped by every write, so a read that raced a write doesn't
+        # cache what it read
+        self.generation = 0
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _query(self, sql, params=()):
+        """Run a read query on a pooled connection and return all rows"""
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM users")[0][0]
+
+    def _cached(self, user_id):
+        with self.cache_lock:
+            user = self.cache.get(user_id)
+            if user is not None:
+                self.cache.move_to_end(user_id)
+            return user
+
+    def _remember(self, user_id, user):
+        """Cache a user, or drop it when user is None. Called with
+        cache_lock held."""
+        if user is None:
+            self.cache.pop(user_id, None)
+            return
+        self.cache[user_id] = user
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction. Yields the connection and a dict the
+        caller fills with {user_id: user or None} to update the cache with
+        once the transaction commits."""
+        with self.lock, self.pool.connection() as conn:
+            written = {}
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn, written
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            with self.cache_lock:
+                self.generation += 1
+                for user_id, user in written.items():
+                    self._remember(user_id, user)
+
+    def _row(self, user):
+        return (str(user["id"]), user.get("email"), json.dumps(user, separators=(",", ":")))
+
+    def get(self, user_id):
+        user = self._cached(user_id)
+        if user is None:
+            generation = self.generation
+            rows = self._query("SELECT data FROM users WHERE id = ?", (user_id,))
+            if not rows:
+                return None
+            user = json.loads(rows[0][0])
+            with self.cache_lock:
+                if self.generation == generation:
+                    self._remember(user_id, user)
+        return user
+
+    def find_by_email(self, email):
+        rows = self._query("SELECT data FROM users WHERE email = ? ORDER BY id", (email,))
+        return [json.loads(data) for data, in rows]
+
+    def create_many(self, users):
+        """Insert users in one transaction, replacing any with the same id"""
+        with self._transaction() as (conn, written):
+            conn.executemany("INSERT OR REPLACE INTO users (id, email, data) VALUES (?, ?, ?)",
+                             [self._row(user) for user in users])
+            # Drop rather than cache, so a bulk import doesn't flush the
+            # users that are actually being read
+            for user in users:
+                written[str(user["id"])] = None
+        return len(users)
+
+    def create(self, user):
+        self.create_many([user])
+
+    def replace(self, user_id, user):
+        """Replace a user's whole record, returns False if it doesn't exist"""
+        user = dict(user, id=user_id)
+        with self._transaction() as (conn, written):
+            cursor = conn.execute("UPDATE users SET email = ?2, data = ?3 WHERE id = ?1", self._row(user))
+            if cursor.rowcount == 0:
+                return False
+            written[user_id] = user
+        return True
+
+    def patch(self, user_id, changes):
+        """Apply changes to a user's fields, returns the updated user or
+        None if it doesn't exist. Fields set to None are removed."""
+        with self._transaction() as (conn, written):
+            row = conn.execute("SELECT data FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            user = json.loads(row[0])
+            for field, value in changes.items():
+                if field == "id":
+                    continue
+                if value is None:
+                    user.pop(field, None)
+                else:
+                    user[field] = value
+            conn.execute("UPDATE users SET email = ?2, data = ?3 WHERE id = ?1", self._row(user))
+            written[user_id] = user
+        return user
+
+    def delete(self, user_id):
+        """Remove a user, returns False if it doesn't exist"""
+        with self._transaction() as (conn, written):
+            cursor = conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            written[user_id] = None
+            return cursor.rowcount > 0